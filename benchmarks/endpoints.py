@@ -0,0 +1,575 @@
+"""Measure latency, throughput and query counts of every API route.
+
+    python benchmarks/endpoints.py --users 1000 --posts 10000 --output before.json
+    python benchmarks/endpoints.py --output after.json --compare before.json
+
+Creates a separate database the way the test runner does, seeds it with
+`manage.py seed_benchmark_data` and requests every route of
+`social_media/urls.py` and `user/urls.py` in-process with the Django test
+client, so the numbers cover the Django stack only, without server or
+network. Every route and method gets p50/p95/p99 latency in milliseconds,
+sequential requests per second and queries per request in the JSON report.
+
+`--compare` lists routes whose p95 latency grew by more than `--threshold` or
+that run more queries than in an earlier report and exits with status 1.
+The same `--seed` produces the same data; `--keepdb` reuses the seeded
+database between runs. Background tasks run inline (TASKS_BACKEND "sync") so
+they do not compete with the measured requests, uploads go to a temporary
+MEDIA_ROOT.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Callable
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "social_media_api.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import cache, caches  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models import Count, F  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext,
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import URLResolver, reverse  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import social_media.urls  # noqa: E402
+import user.urls  # noqa: E402
+from social_media.management.commands.seed_benchmark_data import (  # noqa: E402
+    EMAIL_DOMAIN,
+)
+from social_media.models import Comment, Post, TrendingHashtag  # noqa: E402
+from social_media.timeline import home_timeline  # noqa: E402
+from user.models import UserProfile  # noqa: E402
+from user.serializers import TokenObtainPairSerializer  # noqa: E402
+
+SKIPPED = {
+    "social_media:stream": "streams events until the client disconnects",
+}
+
+
+class Fixtures:
+    """Objects the routes are requested with, picked from the seeded data.
+
+    The reader is the user following the most profiles, so feeds are as
+    large as the data allows.
+    """
+
+    def __init__(self, password: str):
+        self.password = password
+        self.reader = (
+            get_user_model()
+            .objects.filter(email__endswith=EMAIL_DOMAIN)
+            .annotate(followed=Count("following"))
+            .order_by("-followed", "pk")
+            .first()
+        )
+        self.profile = self.reader.profile
+        self.other_profile = (
+            UserProfile.objects.exclude(user=self.reader)
+            .annotate(followers=Count("followed_by"))
+            .order_by("-followers", "pk")
+            .first()
+        )
+        self.post = (
+            home_timeline(self.reader).order_by("-likes_amount", "pk").first()
+            or Post.objects.order_by("-likes_amount", "pk").first()
+        )
+        self.own_post = self.reader.posts.first() or self.create_post()
+        self.comment = self.reader.comments.first() or self.create_comment()
+        trend = TrendingHashtag.objects.select_related("hashtag").first()
+        self.hashtag = trend.hashtag.name if trend else "tag0"
+        self.word = "coffee"
+        self.prefix = self.other_profile.user.username[:3]
+        self._access_tokens = {}
+
+    def path_fields(self) -> dict:
+        return {
+            "post": self.post.pk,
+            "own_post": self.own_post.pk,
+            "comment": self.comment.pk,
+            "profile": self.profile.pk,
+            "other_profile": self.other_profile.pk,
+            "hashtag": self.hashtag,
+            "word": self.word,
+            "prefix": self.prefix,
+        }
+
+    def access_token(self, user) -> str:
+        if user.pk not in self._access_tokens:
+            token = TokenObtainPairSerializer.get_token(user)
+            self._access_tokens[user.pk] = str(token.access_token)
+        return self._access_tokens[user.pk]
+
+    def refresh_token(self) -> str:
+        return str(TokenObtainPairSerializer.get_token(self.reader))
+
+    def create_post(self) -> Post:
+        return Post.objects.create(user=self.reader, text_content="Benchmark post")
+
+    def create_comment(self) -> Comment:
+        Post.objects.filter(pk=self.post.pk).update(
+            comments_amount=F("comments_amount") + 1
+        )
+        return Comment.objects.create(
+            user=self.reader, post=self.post, comment_contents="Benchmark comment"
+        )
+
+    def create_user(self):
+        name = uuid.uuid4().hex
+        return get_user_model().objects.create(
+            email=f"{name}@{EMAIL_DOMAIN}",
+            username=name,
+            password=self.reader.password,
+        )
+
+    def create_profile(self) -> UserProfile:
+        return UserProfile.objects.create(user=self.create_user(), bio="Benchmark")
+
+    @staticmethod
+    def image(index: int) -> SimpleUploadedFile:
+        # Distinct content, so the storage does not deduplicate the uploads
+        file = BytesIO()
+        Image.new("RGB", (640, 480), (index % 256, index // 256 % 256, 128)).save(
+            file, "PNG"
+        )
+        return SimpleUploadedFile("benchmark.png", file.getvalue(), "image/png")
+
+
+@dataclass
+class Route:
+    name: str
+    method: str = "GET"
+    pk: str = None
+    query: str = ""
+    data: object = None
+    variant: str = ""
+    anonymous: bool = False
+    multipart: bool = False
+    max_iterations: int = None
+    # Runs before the timer, returns `data`, `user` or path fields to override
+    prepare: Callable[[Fixtures, int], dict] = None
+
+    @property
+    def key(self) -> str:
+        key = f"{self.method} {self.name}"
+        if self.anonymous:
+            key += " [anonymous]"
+        if self.variant:
+            key += f" [{self.variant}]"
+        return key
+
+    def path(self, fields: dict) -> str:
+        path = reverse(self.name, kwargs={"pk": fields[self.pk]} if self.pk else None)
+        if self.query:
+            path += "?" + self.query.format(**fields)
+        return path
+
+
+def new_post_data(fixtures: Fixtures, index: int) -> dict:
+    return {
+        "text_content": f"Benchmark post {index} #{fixtures.hashtag}",
+        "hashtags": [{"name": fixtures.hashtag}],
+    }
+
+
+ROUTES = [
+    Route("social_media:api-root"),
+    Route("social_media:all-posts-list"),
+    Route("social_media:all-posts-list", anonymous=True),
+    Route("social_media:all-posts-list", query="hashtags={hashtag}", variant="hashtag"),
+    Route("social_media:all-posts-detail", pk="post"),
+    Route("social_media:all-posts-detail", pk="post", anonymous=True),
+    Route("social_media:all-posts-liked-posts"),
+    Route("social_media:all-posts-comment-thread", pk="post"),
+    Route("social_media:all-posts-likers", pk="post"),
+    Route(
+        "social_media:all-posts-comments",
+        "POST",
+        pk="post",
+        data={"comment_contents": "Benchmark comment"},
+    ),
+    Route("social_media:all-posts-like", "POST", pk="post", data={}),
+    Route("social_media:my-posts-list"),
+    Route(
+        "social_media:my-posts-list",
+        "POST",
+        prepare=lambda fixtures, index: {"data": new_post_data(fixtures, index)},
+    ),
+    Route(
+        "social_media:my-posts-bulk",
+        "POST",
+        prepare=lambda fixtures, index: {
+            "data": [new_post_data(fixtures, index) for _ in range(10)]
+        },
+    ),
+    Route("social_media:my-posts-detail", pk="own_post"),
+    Route(
+        "social_media:my-posts-detail",
+        "PUT",
+        pk="own_post",
+        prepare=lambda fixtures, index: {"data": new_post_data(fixtures, index)},
+    ),
+    Route(
+        "social_media:my-posts-detail",
+        "PATCH",
+        pk="own_post",
+        data={"text_content": "Edited benchmark post"},
+    ),
+    Route(
+        "social_media:my-posts-detail",
+        "DELETE",
+        pk="own_post",
+        prepare=lambda fixtures, index: {"own_post": fixtures.create_post().pk},
+    ),
+    Route(
+        "social_media:my-posts-upload-image",
+        "POST",
+        pk="own_post",
+        multipart=True,
+        prepare=lambda fixtures, index: {"data": {"image": fixtures.image(index)}},
+    ),
+    Route("social_media:comments-list"),
+    Route("social_media:comments-detail", pk="comment"),
+    Route(
+        "social_media:comments-detail",
+        "PUT",
+        pk="comment",
+        data={"comment_contents": "Edited benchmark comment"},
+    ),
+    Route(
+        "social_media:comments-detail",
+        "PATCH",
+        pk="comment",
+        data={"comment_contents": "Edited benchmark comment"},
+    ),
+    Route(
+        "social_media:comments-detail",
+        "DELETE",
+        pk="comment",
+        prepare=lambda fixtures, index: {"comment": fixtures.create_comment().pk},
+    ),
+    Route("social_media:hashtags-trending", anonymous=True),
+    Route("social_media:search", query="q={word}"),
+    Route("social_media:async-posts-list"),
+    Route("social_media:async-posts-detail", pk="post"),
+    Route("user:api-root"),
+    Route(
+        "user:register_user",
+        "POST",
+        anonymous=True,
+        prepare=lambda fixtures, index: {
+            "data": {
+                "email": f"{uuid.uuid4().hex}@{EMAIL_DOMAIN}",
+                "username": f"registered{index}",
+                "password": fixtures.password,
+            }
+        },
+    ),
+    Route(
+        "user:token_obtain_pair",
+        "POST",
+        anonymous=True,
+        # Password hashing dominates, a few requests are enough
+        max_iterations=20,
+        prepare=lambda fixtures, index: {
+            "data": {"email": fixtures.reader.email, "password": fixtures.password}
+        },
+    ),
+    Route(
+        "user:token_refresh",
+        "POST",
+        anonymous=True,
+        prepare=lambda fixtures, index: {"data": {"refresh": fixtures.refresh_token()}},
+    ),
+    Route(
+        "user:auth_logout",
+        "POST",
+        prepare=lambda fixtures, index: {
+            "data": {"refresh_token": fixtures.refresh_token()}
+        },
+    ),
+    Route("user:async-profiles-list"),
+    Route("user:all-profiles-list"),
+    Route("user:all-profiles-list", anonymous=True),
+    Route("user:all-profiles-list", query="username={prefix}", variant="username"),
+    Route("user:all-profiles-following"),
+    Route("user:all-profiles-typeahead", query="q={prefix}"),
+    Route("user:all-profiles-detail", pk="other_profile"),
+    Route("user:all-profiles-follow-user", "POST", pk="other_profile", data={}),
+    Route("user:my-profile-list"),
+    Route(
+        "user:my-profile-list",
+        "POST",
+        prepare=lambda fixtures, index: {
+            "user": fixtures.create_user(),
+            "data": {"bio": "Benchmark"},
+        },
+    ),
+    Route("user:my-profile-follower-list"),
+    Route("user:my-profile-detail", pk="profile"),
+    Route("user:my-profile-detail", "PUT", pk="profile", data={"bio": "Edited"}),
+    Route("user:my-profile-detail", "PATCH", pk="profile", data={"bio": "Edited"}),
+    Route(
+        "user:my-profile-detail",
+        "DELETE",
+        pk="profile",
+        prepare=lambda fixtures, index: {
+            "user": (profile := fixtures.create_profile()).user,
+            "profile": profile.pk,
+        },
+    ),
+]
+
+
+def url_names(urlconf) -> set[str]:
+    names = set()
+
+    def collect(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                collect(pattern.url_patterns)
+            elif pattern.name:
+                names.add(f"{urlconf.app_name}:{pattern.name}")
+
+    collect(urlconf.urlpatterns)
+    return names
+
+
+def uncovered_routes() -> list[str]:
+    """URL names with neither a benchmark nor a reason to skip them"""
+    names = url_names(social_media.urls) | url_names(user.urls)
+    covered = {route.name for route in ROUTES} | set(SKIPPED)
+    return sorted(names - covered)
+
+
+def percentile(values: list[float], percent: int) -> float:
+    # Nearest rank on sorted values
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+
+def send(client: Client, route: Route, path: str, data, headers: dict):
+    if route.multipart:
+        return client.post(path, data, **headers)
+    body = "" if data is None else json.dumps(data)
+    return client.generic(
+        route.method, path, body, content_type="application/json", **headers
+    )
+
+
+def measure(
+    client: Client, fixtures: Fixtures, route: Route, iterations: int, warmup: int
+) -> dict:
+    if route.max_iterations:
+        iterations = min(iterations, route.max_iterations)
+    # Every route starts with a cold response cache
+    cache.clear()
+
+    latencies, queries, statuses = [], [], Counter()
+    for index in range(warmup + iterations):
+        prepared = route.prepare(fixtures, index) if route.prepare else {}
+        fields = fixtures.path_fields() | prepared
+        user = prepared.get("user", None if route.anonymous else fixtures.reader)
+        headers = {}
+        if user is not None:
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {fixtures.access_token(user)}"
+        path = route.path(fields)
+        data = prepared.get("data", route.data)
+        # Login throttling would turn the measurement into 429s
+        caches["throttle"].clear()
+
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = send(client, route, path, data, headers)
+            elapsed = time.perf_counter() - started
+
+        if index < warmup:
+            continue
+        latencies.append(elapsed)
+        queries.append(len(context.captured_queries))
+        statuses[response.status_code] += 1
+
+    latencies.sort()
+    return {
+        "requests": iterations,
+        "requests_per_second": round(iterations / sum(latencies), 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+        },
+        "queries": {"mean": round(statistics.mean(queries), 1), "max": max(queries)},
+        "statuses": dict(statuses),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for key, result in report["routes"].items():
+        before = baseline["routes"].get(key)
+        if before is None:
+            continue
+
+        if result["queries"]["max"] > before["queries"]["max"]:
+            regressions.append(
+                f"{key}: queries {before['queries']['max']} -> "
+                f"{result['queries']['max']}"
+            )
+
+        p95, old_p95 = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95 > old_p95 * (1 + threshold):
+            regressions.append(f"{key}: p95 {old_p95} ms -> {p95} ms")
+    return regressions
+
+
+def run(args) -> dict:
+    uncovered = uncovered_routes()
+    if uncovered:
+        raise SystemExit(f"Routes without benchmark: {', '.join(uncovered)}")
+
+    seed_options = {
+        "users": args.users,
+        "posts": args.posts,
+        "likes": args.likes,
+        "comments": args.comments,
+        "hashtags": args.hashtags,
+        "follows": args.follows,
+        "seed": args.seed,
+        "password": args.password,
+    }
+    if not get_user_model().objects.filter(email__endswith=EMAIL_DOMAIN).exists():
+        started = time.perf_counter()
+        call_command("seed_benchmark_data", **seed_options, stdout=sys.stderr)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    fixtures = Fixtures(args.password)
+    client = Client()
+    routes = [
+        route
+        for route in ROUTES
+        if not args.routes or any(name in route.key for name in args.routes)
+    ]
+
+    results = {}
+    for route in routes:
+        results[route.key] = measure(
+            client, fixtures, route, args.iterations, args.warmup
+        )
+        print(
+            f"{route.key}: p95 {results[route.key]['latency_ms']['p95']} ms, "
+            f"{results[route.key]['queries']['max']} queries",
+            file=sys.stderr,
+        )
+
+    seed_options.pop("password")
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "seed": seed_options,
+        "iterations": args.iterations,
+        "warmup": args.warmup,
+        "skipped": SKIPPED,
+        "routes": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--likes", type=int, default=50_000)
+    parser.add_argument("--comments", type=int, default=20_000)
+    parser.add_argument("--hashtags", type=int, default=200)
+    parser.add_argument("--follows", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument(
+        "--routes", nargs="*", help="Only routes whose key contains one of these"
+    )
+    parser.add_argument("--keepdb", action="store_true")
+    parser.add_argument("--output", help="Report path, stdout by default")
+    parser.add_argument("--compare", help="Earlier report to check for regressions")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Allowed relative p95 growth"
+    )
+    args = parser.parse_args()
+
+    if connection.vendor == "sqlite" and not connection.settings_dict["TEST"]["NAME"]:
+        # The test runner default, an in-memory database, would hide disk access
+        connection.settings_dict["TEST"]["NAME"] = str(BASE_DIR / "benchmark.sqlite3")
+
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=args.keepdb)
+    try:
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, TASKS_BACKEND="sync"
+        ):
+            report = run(args)
+    finally:
+        teardown_databases(old_config, verbosity=0, keepdb=args.keepdb)
+        teardown_test_environment()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline["seed"] != report["seed"]:
+            print("Warning: the reports were seeded differently", file=sys.stderr)
+        regressions = compare(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
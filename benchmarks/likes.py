@@ -0,0 +1,150 @@
+"""Measure write throughput of a running server under concurrent likes.
+
+    python benchmarks/likes.py --url http://127.0.0.1:8000 --users 20 \\
+        --requests 2000 --concurrency 32
+
+Registers an author with a few posts and `--users` accounts following it
+(reused on later runs), then sends like / unlike requests for random
+posts from all accounts at once and prints a JSON summary. Compare runs of
+the same server with different DATABASE_PROFILE values, or before and after
+a change; 5xx statuses are usually "database is locked" errors. Raise
+LOGIN_IP_RATE on the server when `--users` is above its login rate.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def call(method: str, url: str, data=None, token: str = None) -> tuple:
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(
+        url,
+        data=None if data is None else json.dumps(data).encode(),
+        headers=headers,
+        method=method,
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    elapsed = time.perf_counter() - started
+
+    try:
+        body = json.loads(body) if body else None
+    except ValueError:
+        pass
+    return status, body, elapsed
+
+
+def account(base: str, email: str, password: str) -> str:
+    """Register the account and its profile unless they exist, return a token"""
+    username = email.split("@")[0]
+    call(
+        "POST",
+        f"{base}/user/register/",
+        {"email": email, "password": password, "username": username},
+    )
+    status, body, _ = call(
+        "POST", f"{base}/user/token/", {"email": email, "password": password}
+    )
+    if status != 200:
+        raise SystemExit(f"Login of {email} failed with {status}: {body}")
+
+    token = body["access"]
+    call("POST", f"{base}/user/my-profile/", {"bio": "Benchmark"}, token)
+    return token
+
+
+def setup(base: str, users: int, posts: int, password: str) -> tuple:
+    author = account(base, "likes-author@example.com", password)
+    _, profiles, _ = call("GET", f"{base}/user/my-profile/", token=author)
+    profile_id = profiles[0]["id"]
+
+    _, own_posts, _ = call(
+        "GET", f"{base}/api/my-posts/?page_size={posts}", token=author
+    )
+    post_ids = [post["id"] for post in own_posts["results"]]
+    for index in range(len(post_ids), posts):
+        _, post, _ = call(
+            "POST",
+            f"{base}/api/my-posts/",
+            {"text_content": f"Benchmark post {index}", "hashtags": []},
+            author,
+        )
+        post_ids.append(post["id"])
+
+    tokens = []
+    for index in range(users):
+        token = account(base, f"likes-user{index}@example.com", password)
+        # Followed posts are in the timeline, liking needs them there
+        call(
+            "POST",
+            f"{base}/user/profiles/{profile_id}/follow-user/",
+            {"follow": True},
+            token,
+        )
+        tokens.append(token)
+
+    return tokens, post_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=5)
+    parser.add_argument("--password", default="benchmark-password-1")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    tokens, post_ids = setup(base, args.users, args.posts, args.password)
+
+    def like(index: int) -> tuple:
+        status, _, elapsed = call(
+            "POST",
+            f"{base}/api/posts/{random.choice(post_ids)}/like/",
+            {"like": random.random() < 0.5},
+            tokens[index % len(tokens)],
+        )
+        return status, elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(like, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    print(
+        json.dumps(
+            {
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "seconds": round(elapsed, 3),
+                "requests_per_second": round(args.requests / elapsed, 1),
+                "latency_ms": {
+                    "p50": round(statistics.median(latencies) * 1000, 1),
+                    "p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+                    "p99": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+                    "max": round(latencies[-1] * 1000, 1),
+                },
+                "statuses": dict(Counter(status for status, _ in results)),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
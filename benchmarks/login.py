@@ -0,0 +1,94 @@
+"""Measure login throughput of a running server.
+
+    python benchmarks/login.py --url http://127.0.0.1:8000 --requests 200 --concurrency 8
+
+Registers the benchmark account if needed, then posts `/user/token/` with a
+mix of valid, wrong-password and unknown-email credentials and prints a JSON
+summary. Raise LOGIN_IP_RATE / LOGIN_ACCOUNT_RATE on the server to measure
+hashing rather than throttling.
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def post(url: str, data: dict) -> tuple[int, float]:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(data).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+def credentials(index: int, email: str, password: str) -> dict:
+    kind = index % 4
+    if kind == 2:
+        return {"email": email, "password": f"{password}-wrong"}
+    if kind == 3:
+        return {"email": f"unknown-{index}@example.com", "password": password}
+    return {"email": email, "password": password}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", default="benchmark@example.com")
+    parser.add_argument("--password", default="benchmark-password-1")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    post(
+        f"{base}/user/register/",
+        {"email": args.email, "password": args.password, "username": "benchmark"},
+    )
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(
+            executor.map(
+                lambda index: post(
+                    f"{base}/user/token/",
+                    credentials(index, args.email, args.password),
+                ),
+                range(args.requests),
+            )
+        )
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    print(
+        json.dumps(
+            {
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "seconds": round(elapsed, 3),
+                "requests_per_second": round(args.requests / elapsed, 1),
+                "latency_ms": {
+                    "p50": round(statistics.median(latencies) * 1000, 1),
+                    "p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+                    "max": round(latencies[-1] * 1000, 1),
+                },
+                "statuses": dict(Counter(status for status, _ in results)),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
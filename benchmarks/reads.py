@@ -0,0 +1,101 @@
+"""Compare read throughput of the sync and async endpoints under load.
+
+Start the same project twice, e.g.
+
+    gunicorn social_media_api.wsgi -w 4 -b 127.0.0.1:8000
+    uvicorn social_media_api.asgi:application --workers 4 --port 8001
+
+then
+
+    python benchmarks/reads.py --wsgi http://127.0.0.1:8000 \\
+        --asgi http://127.0.0.1:8001 --concurrency 64 --requests 2000
+
+Every server is hit on the sync routes and the asgi one on the `async/`
+routes too, with the given amount of concurrent connections. Pass `--token`
+to read the authenticated feed. Prints a JSON summary per server and route.
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROUTES = {
+    "sync": {
+        "feed": "/api/posts/",
+        "post_detail": "/api/posts/{post_id}/",
+        "profiles": "/user/profiles/",
+    },
+    "async": {
+        "feed": "/api/async/posts/",
+        "post_detail": "/api/async/posts/{post_id}/",
+        "profiles": "/user/async/profiles/",
+    },
+}
+
+
+def get(url: str, token: str = None) -> tuple[int, float]:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    request = urllib.request.Request(url, headers=headers)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+def measure(url: str, requests: int, concurrency: int, token: str = None) -> dict:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: get(url, token), range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "requests_per_second": round(requests / elapsed, 1),
+        "latency_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 1),
+            "p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        },
+        "statuses": dict(Counter(status for status, _ in results)),
+    }
+
+
+def first_post_id(base: str) -> int:
+    with urllib.request.urlopen(f"{base}/api/posts/?page_size=1") as response:
+        return json.load(response)["results"][0]["id"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wsgi", default="http://127.0.0.1:8000")
+    parser.add_argument("--asgi", default="http://127.0.0.1:8001")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--token", help="JWT access token for authenticated reads")
+    args = parser.parse_args()
+
+    report = {"requests": args.requests, "concurrency": args.concurrency}
+    for server, base, kinds in (
+        ("wsgi", args.wsgi.rstrip("/"), ["sync"]),
+        ("asgi", args.asgi.rstrip("/"), ["sync", "async"]),
+    ):
+        post_id = first_post_id(base)
+        for kind in kinds:
+            for name, path in ROUTES[kind].items():
+                url = base + path.format(post_id=post_id)
+                report[f"{server}:{kind}:{name}"] = measure(
+                    url, args.requests, args.concurrency, args.token
+                )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
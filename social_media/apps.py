@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SocialMediaConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "social_media"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from social_media_api import db  # noqa: F401
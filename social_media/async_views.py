@@ -0,0 +1,210 @@
+"""Native async versions of the hottest read endpoints.
+
+Served next to the DRF viewsets under `async/` prefixes with the same
+queries, pagination and payloads. Under ASGI they await the ORM directly
+instead of running the whole view in a `sync_to_async` thread; serializers
+only read prefetched data, so they run on the event loop.
+"""
+import asyncio
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from social_media_api.metrics import TimedJSONRenderer
+from user.authentication import aauthenticate
+from user.models import User, UserProfile
+from user.tokens import StreamToken
+from .events import author_channel, get_broker, user_channel
+from .filters import PostFilter
+from .models import Post
+from .pagination import KeysetCursorPagination, TimelinePagination
+from .serializers import PostDetailSerializer, PostListSerializer
+from .timeline import home_timeline, timeline_querysets
+from .views import PostQuerysetMixin
+
+
+class AsyncReadView(View):
+    """GET-only async view answering JSON like a DRF view would"""
+
+    http_method_names = ["get"]
+
+    async def get(self, request, *args, **kwargs):
+        drf_request = Request(request)
+        try:
+            drf_request.user = await aauthenticate(request)
+            data = await self.aget_data(drf_request, *args, **kwargs)
+        except APIException as exc:
+            return self.render_exception(exc)
+        except Http404:
+            return self.render({"detail": "Not found."}, status.HTTP_404_NOT_FOUND)
+
+        return self.render(data)
+
+    async def aget_data(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    @staticmethod
+    def render(data, status_code=status.HTTP_200_OK) -> HttpResponse:
+        return HttpResponse(
+            TimedJSONRenderer().render(data),
+            status=status_code,
+            content_type="application/json",
+        )
+
+    @classmethod
+    def render_exception(cls, exc: APIException) -> HttpResponse:
+        # Same body as DRF's exception handler
+        if isinstance(exc.detail, (list, dict)):
+            return cls.render(exc.detail, exc.status_code)
+        return cls.render({"detail": exc.detail}, exc.status_code)
+
+
+class AsyncPaginatedReadView(AsyncReadView):
+    pagination_class = KeysetCursorPagination
+
+    async def apaginate(self, queryset, request):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+        return paginator, page
+
+    async def apaginate_timeline(self, querysets, request):
+        paginator = TimelinePagination()
+        page = await paginator.apaginate_querysets(querysets, request, view=self)
+        return paginator, page
+
+    @staticmethod
+    def paginated_data(paginator, data) -> dict:
+        return {
+            "next": paginator.get_next_link(),
+            "previous": paginator.get_previous_link(),
+            "results": data,
+        }
+
+
+class AsyncPostQuerysetMixin(PostQuerysetMixin):
+    def get_queryset(self, request):
+        if request.user.is_anonymous:
+            queryset = Post.objects.all()
+        else:
+            queryset = home_timeline(request.user)
+
+        return self.optimize_queryset(queryset)
+
+
+class AsyncPostListView(AsyncPostQuerysetMixin, AsyncPaginatedReadView):
+    """Endpoint for the feed, same as GET /api/posts/"""
+
+    action = "list"
+
+    async def aget_data(self, request):
+        if request.user.is_anonymous:
+            queryset = PostFilter(
+                request.query_params, queryset=self.get_queryset(request)
+            ).qs
+            paginator, page = await self.apaginate(queryset, request)
+        else:
+            querysets = [
+                PostFilter(
+                    request.query_params, queryset=self.optimize_queryset(queryset)
+                ).qs
+                for queryset in timeline_querysets(request.user)
+            ]
+            paginator, page = await self.apaginate_timeline(querysets, request)
+        serializer = PostListSerializer(page, many=True, context={"request": request})
+
+        return self.paginated_data(paginator, serializer.data)
+
+
+class AsyncPostDetailView(AsyncPostQuerysetMixin, AsyncReadView):
+    """Endpoint for a post with its first comments, same as GET /api/posts/{id}/"""
+
+    action = "retrieve"
+
+    async def aget_data(self, request, pk):
+        try:
+            post = await self.get_queryset(request).aget(pk=pk)
+        except Post.DoesNotExist:
+            raise Http404
+
+        return PostDetailSerializer(post, context={"request": request}).data
+
+
+class EventStreamView(View):
+    """Endpoint for server-sent events: new posts of followed users, likes
+    and comments on own posts. Follows made later apply on reconnect.
+    Authenticated by a `?token=` from POST /api/stream/token/ or a Bearer
+    header"""
+
+    http_method_names = ["get"]
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            # WSGI handlers consume the endless stream before responding
+            return AsyncReadView.render(
+                {"detail": "The event stream is only served under ASGI."},
+                status.HTTP_501_NOT_IMPLEMENTED,
+            )
+
+        try:
+            user = await self.authenticate(request)
+        except APIException as exc:
+            return AsyncReadView.render_exception(exc)
+        if user.is_anonymous:
+            return AsyncReadView.render(
+                {"detail": "Authentication credentials were not provided."},
+                status.HTTP_401_UNAUTHORIZED,
+            )
+
+        channels = [user_channel(user.id)] + [
+            author_channel(author_id)
+            async for author_id in UserProfile.objects.filter(
+                followed_by=user
+            ).values_list("user_id", flat=True)
+        ]
+
+        response = StreamingHttpResponse(
+            self.stream(channels), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    @staticmethod
+    async def authenticate(request):
+        raw_token = request.GET.get("token")
+        if raw_token is None:
+            return await aauthenticate(request)
+
+        try:
+            token = StreamToken(raw_token)
+        except TokenError as exc:
+            raise InvalidToken(exc.args[0])
+        user = await User.objects.filter(
+            pk=token[api_settings.USER_ID_CLAIM], is_active=True
+        ).afirst()
+        return user or AnonymousUser()
+
+    @staticmethod
+    async def stream(channels):
+        async with get_broker().subscribe(channels) as subscription:
+            yield f"retry: {settings.EVENTS_RETRY_MILLISECONDS}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), timeout=settings.EVENTS_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,133 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .cache import invalidate
+from .models import Hashtag, Post
+from .search import index_posts
+from .serializers import PostHashtagSerializer
+from .timeline import fan_out_posts
+
+
+def parse_json_lines(lines):
+    """Yield one item per non-blank line of a JSON-lines stream"""
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ParseError(f"JSON-lines parse error on line {number} - {e}")
+
+
+class JSONLinesParser(BaseParser):
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return list(parse_json_lines(stream))
+
+
+class BulkPostImporter:
+    """Create posts from raw items in chunks of `batch_size`.
+
+    Every chunk is validated item by item with PostHashtagSerializer and then
+    written with one bulk_create for posts, one hashtag resolution and one
+    bulk_create for post-hashtag rows. Invalid items are reported by their
+    index and do not stop the import.
+    Given a `user`, every item is created by it and the items' own `user` is
+    ignored. Otherwise each item's `user` holds the email of its author.
+    """
+
+    def __init__(self, user=None, batch_size=None):
+        self.user = user
+        self.batch_size = batch_size or settings.BULK_POSTS_BATCH_SIZE
+        self.created_ids = []
+        self.errors = []
+
+    def run(self, items) -> dict:
+        items = iter(enumerate(items))
+        while chunk := list(islice(items, self.batch_size)):
+            self.import_chunk(chunk)
+
+        return {
+            "created": len(self.created_ids),
+            "failed": len(self.errors),
+            "ids": self.created_ids,
+            "errors": self.errors,
+        }
+
+    def import_chunk(self, chunk) -> None:
+        users = self._resolve_users(chunk)
+        valid = []
+
+        for index, item in chunk:
+            if not isinstance(item, dict):
+                self.errors.append(
+                    {
+                        "index": index,
+                        "errors": {"non_field_errors": ["Expected an object."]},
+                    }
+                )
+                continue
+
+            email = item.get("user")
+            user = self.user or (users.get(email) if isinstance(email, str) else None)
+            if user is None:
+                self.errors.append(
+                    {"index": index, "errors": {"user": ["Unknown or missing user."]}}
+                )
+                continue
+
+            serializer = PostHashtagSerializer(data=item)
+            if not serializer.is_valid():
+                self.errors.append({"index": index, "errors": serializer.errors})
+                continue
+
+            valid.append((user, serializer.validated_data))
+
+        if valid:
+            with transaction.atomic():
+                self._create_posts(valid)
+                transaction.on_commit(lambda: invalidate("posts"))
+
+    def _create_posts(self, valid) -> None:
+        posts = Post.objects.bulk_create(
+            Post(user=user, text_content=data["text_content"]) for user, data in valid
+        )
+
+        hashtags = Hashtag.objects.get_or_create_many(
+            tag["name"] for _, data in valid for tag in data["hashtags"]
+        )
+        hashtag_ids = {hashtag.name: hashtag.id for hashtag in hashtags}
+
+        Post.hashtags.through.objects.bulk_create(
+            [
+                Post.hashtags.through(post_id=post.id, hashtag_id=hashtag_ids[name])
+                for post, (_, data) in zip(posts, valid)
+                for name in {tag["name"] for tag in data["hashtags"]}
+            ],
+            ignore_conflicts=True,
+        )
+
+        fan_out_posts(posts)
+        index_posts(posts)
+        self.created_ids.extend(post.id for post in posts)
+
+    def _resolve_users(self, chunk) -> dict:
+        if self.user is not None:
+            return {}
+
+        emails = {
+            item.get("user")
+            for _, item in chunk
+            if isinstance(item, dict) and isinstance(item.get("user"), str)
+        }
+        users = get_user_model().objects.filter(email__in=emails)
+        return {user.email: user for user in users}
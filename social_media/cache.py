@@ -0,0 +1,95 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _generation_key(namespace: str) -> str:
+    return f"response-cache:{namespace}:generation"
+
+
+def get_generation(namespace: str) -> int:
+    return cache.get_or_set(_generation_key(namespace), time.time_ns, timeout=None)
+
+
+def invalidate(*namespaces: str) -> None:
+    """Orphan every cached payload of the namespaces by bumping their generation"""
+    for namespace in namespaces:
+        try:
+            cache.incr(_generation_key(namespace))
+        except ValueError:
+            cache.set(_generation_key(namespace), time.time_ns(), timeout=None)
+
+
+def get_or_compute(key: str, compute, timeout: int):
+    """Return the cached value of `key`, computing it at most once at a time.
+
+    On a miss only the caller holding the lock hits the database, others
+    poll the cache until the value appears or the lock expires. A holder
+    whose value isn't cacheable releases the lock without one, the next
+    waiter takes the lock over and computes its own.
+    `compute` returns a `(value, cacheable)` pair.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    lock_timeout = settings.RESPONSE_CACHE_LOCK_TIMEOUT
+    deadline = time.monotonic() + lock_timeout
+
+    while not cache.add(lock_key, 1, lock_timeout):
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(settings.RESPONSE_CACHE_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+    try:
+        value, cacheable = compute()
+        if cacheable:
+            cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+
+    return value
+
+
+class AnonymousResponseCacheMixin:
+    """Serve list and retrieve payloads for anonymous users from the cache.
+
+    Payloads are keyed by the full path (filters and cursor included) and the
+    current generation of `cache_namespace`, which model signals bump.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        generation = get_generation(self.cache_namespace)
+        key = f"response-cache:{self.cache_namespace}:{generation}:{path_hash}"
+
+        def compute():
+            response = handler(request, *args, **kwargs)
+            return (
+                (response.status_code, response.data),
+                response.status_code == status.HTTP_200_OK,
+            )
+
+        status_code, data = get_or_compute(
+            key, compute, settings.RESPONSE_CACHE_TIMEOUT
+        )
+        return Response(data, status=status_code)
@@ -0,0 +1,161 @@
+"""Publish/subscribe of live events for the `/api/stream/` endpoint.
+
+Channels: `author:<user id>` carries new posts of that user to followers,
+`user:<user id>` carries likes and comments on that user's posts.
+`EVENTS_BROKER = "memory"` delivers within the process (a single ASGI
+server process); `"redis"` goes through a Redis-protocol server at
+`EVENTS_REDIS_URL` so every worker sees every event.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+
+def author_channel(user_id: int) -> str:
+    return f"author:{user_id}"
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+class InProcessSubscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def deliver(self, event: dict) -> None:
+        """Thread safe, events for a client that can't keep up are dropped"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # The event loop of the subscriber is already closed
+
+    def _put(self, event: dict) -> None:
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, event: dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        subscription = InProcessSubscription(asyncio.get_running_loop())
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                for channel in channels:
+                    self._subscriptions[channel].discard(subscription)
+                    if not self._subscriptions[channel]:
+                        del self._subscriptions[channel]
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self) -> dict:
+        while True:
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=None
+            )
+            if message is not None:
+                return json.loads(message["data"])
+
+
+class RedisBroker:
+    """Needs the `redis` package, already required by the Redis cache"""
+
+    prefix = "events:"
+
+    def __init__(self, url: str):
+        import redis
+
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel: str, event: dict) -> None:
+        self.client.publish(self.prefix + channel, json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        from redis import asyncio as redis_asyncio
+
+        client = redis_asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(*[self.prefix + channel for channel in channels])
+        try:
+            yield RedisSubscription(pubsub)
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            if settings.EVENTS_BROKER == "redis":
+                _broker = RedisBroker(settings.EVENTS_REDIS_URL)
+            else:
+                _broker = InProcessBroker()
+        return _broker
+
+
+def publish(channel: str, event: dict) -> None:
+    """Publish `event` once the current transaction commits"""
+    transaction.on_commit(lambda: get_broker().publish(channel, event))
+
+
+def publish_post(post) -> None:
+    publish(
+        author_channel(post.user_id),
+        {"type": "post", "post": post.id, "user": post.user_id},
+    )
+
+
+def publish_like(post, user) -> None:
+    if post.user_id != user.id:
+        publish(
+            user_channel(post.user_id),
+            {"type": "like", "post": post.id, "user": user.id},
+        )
+
+
+def publish_comment(comment) -> None:
+    if comment.post.user_id != comment.user_id:
+        publish(
+            user_channel(comment.post.user_id),
+            {
+                "type": "comment",
+                "post": comment.post_id,
+                "comment": comment.id,
+                "user": comment.user_id,
+            },
+        )
@@ -1,12 +1,24 @@
 import django_filters
-from .models import Post
+
+from .models import Post, normalize_hashtag
 
 
 class PostFilter(django_filters.FilterSet):
-    hashtags = django_filters.CharFilter(
-        field_name="hashtags__name", lookup_expr="icontains"
-    )
+    hashtags = django_filters.CharFilter(method="filter_hashtag")
+    hashtag_prefix = django_filters.CharFilter(method="filter_hashtag_prefix")
 
     class Meta:
         model = Post
-        fields = ["hashtags"]
+        fields = ["hashtags", "hashtag_prefix"]
+
+    def filter_hashtag(self, queryset, name, value):
+        return queryset.filter(hashtags__name=normalize_hashtag(value))
+
+    def filter_hashtag_prefix(self, queryset, name, value):
+        # A range instead of LIKE keeps the lookup on the unique name index
+        prefix = normalize_hashtag(value)
+        tagged_posts = Post.hashtags.through.objects.filter(
+            hashtag__name__gte=prefix, hashtag__name__lt=f"{prefix}\U0010ffff"
+        ).values("post_id")
+
+        return queryset.filter(pk__in=tagged_posts)
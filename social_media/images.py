@@ -0,0 +1,82 @@
+"""Image processing helpers: stripped originals and resized WebP variants.
+
+Every generated file is re-encoded from pixel data only, so EXIF (GPS,
+camera serials), XMP and ICC metadata of the upload never reach the feed.
+"""
+import io
+import os.path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+ORIGINAL = "original"
+
+# Formats the stripped original is re-encoded to, anything else becomes PNG
+ORIGINAL_FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+
+def store(directory: str, data: bytes, extension: str) -> str:
+    """Save `data`, the storage names it after its hash and dedupes it"""
+    return default_storage.save(
+        os.path.join(directory, f"image.{extension}"), ContentFile(data)
+    )
+
+
+def held_media(image_name: str, variants: dict) -> list[str]:
+    """Storage names an image field and its variants hold a reference on"""
+    names = list(variants.values())
+    if image_name and image_name != variants.get(ORIGINAL):
+        names.append(image_name)
+    return names
+
+
+def encode(image: Image.Image, image_format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def web_mode(image: Image.Image) -> Image.Image:
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    has_alpha = "A" in image.getbands() or "transparency" in image.info
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def build_variants(file, directory: str) -> dict[str, str]:
+    """Store a stripped original and one WebP per `IMAGE_VARIANTS` size.
+
+    Returns storage names by variant, `original` included.
+    """
+    with file.open("rb"):
+        source = Image.open(file)
+        source_format = source.format
+        source.load()
+
+    image = ImageOps.exif_transpose(source)
+    image.info = {}
+
+    original_format = source_format if source_format in ORIGINAL_FORMATS else "PNG"
+    if original_format == "JPEG":
+        image = image.convert("RGB")
+    variants = {
+        ORIGINAL: store(
+            directory,
+            encode(image, original_format, quality=90),
+            ORIGINAL_FORMATS[original_format],
+        )
+    }
+
+    image = web_mode(image)
+    for name, size in settings.IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[name] = store(
+            os.path.join(directory, "variants"),
+            encode(resized, "WEBP", quality=settings.IMAGE_WEBP_QUALITY),
+            "webp",
+        )
+
+    return variants
@@ -0,0 +1,118 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from social_media.images import held_media
+from social_media.models import MediaBlob, Post
+from user.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete media files no post or profile references anymore. "
+        "With --reconcile, recount references from the database first and "
+        "also delete untracked files (best run while uploads are quiet)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-seconds", type=int, default=settings.MEDIA_GC_GRACE_SECONDS
+        )
+        parser.add_argument("--reconcile", action="store_true")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        if options["reconcile"] and not dry_run:
+            self.reconcile()
+
+        cutoff = timezone.now() - timedelta(seconds=options["grace_seconds"])
+
+        deleted, freed = 0, 0
+        orphans = MediaBlob.objects.filter(refs__lte=0, updated_at__lt=cutoff)
+        for blob in orphans.iterator():
+            if dry_run:
+                size = self.delete(blob.name, dry_run)
+            else:
+                size = self.collect(blob)
+                if size is None:
+                    continue
+            deleted, freed = deleted + 1, freed + size
+
+        if options["reconcile"]:
+            for name in self.untracked_files(cutoff):
+                deleted, freed = deleted + 1, freed + self.delete(name, dry_run)
+
+        action = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(f"{action} {deleted} files ({freed} bytes)")
+        )
+
+    def collect(self, blob: MediaBlob):
+        """Delete an orphan and its file, None if it was referenced again"""
+        with transaction.atomic():
+            # Re-checked under the row lock, an upload of the same contents
+            # waits in MediaBlob.objects.acquire until the file is gone and
+            # stores it again. SQLite has no row locks, its conditional
+            # delete takes the database write lock instead
+            orphan = MediaBlob.objects.select_for_update().filter(
+                pk=blob.pk, refs__lte=0
+            )
+            if not orphan.exists() or not orphan.delete()[0]:
+                return None
+            return self.delete(blob.name, dry_run=False)
+
+    def delete(self, name: str, dry_run: bool) -> int:
+        if not default_storage.exists(name):
+            return 0
+        size = default_storage.size(name)
+        if not dry_run:
+            default_storage.delete(name)
+        return size
+
+    def reconcile(self) -> None:
+        references = Counter()
+        for image, variants in Post.objects.values_list(
+            "image", "image_variants"
+        ).iterator():
+            references.update(held_media(image, variants))
+        for image, variants in UserProfile.objects.values_list(
+            "profile_picture", "profile_picture_variants"
+        ).iterator():
+            references.update(held_media(image, variants))
+
+        now = timezone.now()
+        with transaction.atomic():
+            MediaBlob.objects.bulk_create(
+                [MediaBlob(name=name) for name in references], ignore_conflicts=True
+            )
+            changed = []
+            for blob in MediaBlob.objects.only("id", "name", "refs").iterator():
+                refs = references.get(blob.name, 0)
+                if blob.refs != refs:
+                    blob.refs, blob.updated_at = refs, now
+                    changed.append(blob)
+            MediaBlob.objects.bulk_update(
+                changed, ["refs", "updated_at"], batch_size=1000
+            )
+
+        self.stdout.write(f"Recounted references, {len(changed)} changed")
+
+    def untracked_files(self, cutoff):
+        """Files under uploads/ without a MediaBlob, left by older versions
+        or interrupted uploads"""
+        tracked = set(MediaBlob.objects.values_list("name", flat=True))
+        cutoff = cutoff.timestamp()
+        root = default_storage.path("")
+        for directory, _, filenames in os.walk(os.path.join(root, "uploads")):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, "/")
+                if name not in tracked and os.path.getmtime(path) < cutoff:
+                    yield name
@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ParseError
+
+from social_media.bulk import BulkPostImporter, parse_json_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Import posts from a JSON array or JSON-lines file. Every item holds "
+        "text_content, hashtags and optionally the author email in user"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--user", help="Author email for items without user")
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument(
+            "--format", choices=["auto", "json", "jsonl"], default="auto"
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = get_user_model().objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+
+        importer = BulkPostImporter(user=user, batch_size=options["batch_size"])
+        started = time.perf_counter()
+
+        with open(options["path"], encoding="utf-8") as file:
+            try:
+                report = importer.run(self._read_items(file, options["format"]))
+            except (ParseError, ValueError) as e:
+                raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - started
+
+        for error in report["errors"]:
+            self.stderr.write(f"Item {error['index']}: {json.dumps(error['errors'])}")
+
+        rate = report["created"] / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']} posts, {report['failed']} failed "
+                f"in {elapsed:.2f}s ({rate:.0f} posts/s)"
+            )
+        )
+
+    @staticmethod
+    def _read_items(file, format_):
+        if format_ == "auto":
+            first = file.read(1)
+            while first.isspace():
+                first = file.read(1)
+            file.seek(0)
+            format_ = "json" if first == "[" else "jsonl"
+
+        if format_ == "json":
+            items = json.load(file)
+            if not isinstance(items, list):
+                raise CommandError("Expected a JSON array of posts")
+            return items
+
+        return parse_json_lines(file)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from social_media import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text index of posts and comments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        search.create_index()
+
+        with transaction.atomic():
+            indexed = search.rebuild_index(
+                batch_size=options["batch_size"], stdout=self.stdout
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} documents"))
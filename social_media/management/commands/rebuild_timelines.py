@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from social_media.models import TimelineEntry
+from social_media.timeline import backfill_timeline
+from user.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from the current follow graph"
+
+    def handle(self, *args, **options):
+        follows = UserProfile.followed_by.through.objects.select_related(
+            "userprofile"
+        ).order_by("user_id")
+
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+
+            for follow in follows.iterator():
+                backfill_timeline(follow.user_id, follow.userprofile)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt timelines: {TimelineEntry.objects.count()} entries"
+            )
+        )
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from social_media.models import Comment, Post
+
+
+def _count_subquery(queryset):
+    return Coalesce(
+        Subquery(
+            queryset.filter(post_id=OuterRef("pk"))
+            .order_by()
+            .values("post_id")
+            .annotate(amount=Count("*"))
+            .values("amount")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Fix drift between Post like/comment counters and the real counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        real_likes = _count_subquery(Post.likes.through.objects.all())
+        real_comments = _count_subquery(Comment.objects.all())
+
+        last_id = 0
+        fixed = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            drifted = (
+                Post.objects.filter(pk__in=batch)
+                .annotate(real_likes=real_likes, real_comments=real_comments)
+                .filter(
+                    ~Q(likes_amount=F("real_likes"))
+                    | ~Q(comments_amount=F("real_comments"))
+                )
+                .values_list("pk", flat=True)
+            )
+            fixed += Post.objects.filter(pk__in=list(drifted)).update(
+                likes_amount=real_likes, comments_amount=real_comments
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} post counters"))
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from social_media.models import Post, TrendingHashtag
+
+
+class Command(BaseCommand):
+    help = "Recompute the hashtags served by /api/hashtags/trending/"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, default=settings.TRENDING_HASHTAGS_WINDOW_HOURS
+        )
+        parser.add_argument(
+            "--limit", type=int, default=settings.TRENDING_HASHTAGS_LIMIT
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = now - timedelta(hours=options["hours"])
+
+        counts = (
+            Post.hashtags.through.objects.filter(post__created_at__gte=since)
+            .values("hashtag_id")
+            .annotate(posts_amount=Count("post_id"))
+            .order_by("-posts_amount", "hashtag_id")[: options["limit"]]
+        )
+
+        with transaction.atomic():
+            TrendingHashtag.objects.all().delete()
+            TrendingHashtag.objects.bulk_create(
+                TrendingHashtag(
+                    hashtag_id=row["hashtag_id"],
+                    posts_amount=row["posts_amount"],
+                    computed_at=now,
+                )
+                for row in counts
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Stored {len(counts)} trending hashtags"))
@@ -0,0 +1,234 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from social_media.cache import invalidate
+from social_media.models import Comment, Hashtag, Like, Post
+from social_media.search import create_index, index_comments, index_posts
+from social_media.timeline import fan_out_posts
+from user.models import UserProfile
+from user.search import index_users
+
+EMAIL_DOMAIN = "bench.example.com"
+
+WORDS = (
+    "morning coffee city travel music weekend photo sunset friends running "
+    "book movie dinner garden project office launch release bug review "
+    "team concert winter summer beach mountain river train flight market"
+).split()
+
+
+def power_law_weights(amount: int, exponent: float) -> list[float]:
+    """Cumulative weights where the item of rank r has weight 1 / r ** exponent"""
+    return list(accumulate(1 / rank**exponent for rank in range(1, amount + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a database with benchmark data: users with a power-law follow "
+        "graph, posts with hashtags, likes and comments"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--posts", type=int, default=10_000)
+        parser.add_argument("--likes", type=int, default=50_000)
+        parser.add_argument("--comments", type=int, default=20_000)
+        parser.add_argument("--hashtags", type=int, default=200)
+        parser.add_argument(
+            "--follows", type=int, default=20, help="Mean followed users per user"
+        )
+        parser.add_argument("--exponent", type=float, default=1.1)
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--password", default="benchmark-password")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["users"] < 2:
+            raise CommandError("At least 2 users are needed")
+        if get_user_model().objects.filter(email__endswith=EMAIL_DOMAIN).exists():
+            raise CommandError("Benchmark data is already seeded")
+
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        self.period = timedelta(days=options["days"]).total_seconds()
+
+        with transaction.atomic():
+            users = self.create_users(options["users"], options["password"])
+            # Popularity rank is independent of the id order
+            self.popular = self.random.sample(users, len(users))
+            self.popularity = power_law_weights(len(users), options["exponent"])
+
+            self.create_follows(users, options["follows"])
+            posts = self.create_posts(
+                options["posts"], options["hashtags"], options["exponent"]
+            )
+            self.create_likes(users, posts, options["likes"], options["exponent"])
+            self.create_comments(users, posts, options["comments"], options["exponent"])
+
+            call_command("reconcile_post_counters", stdout=self.stdout)
+            call_command("reconcile_profile_counters", stdout=self.stdout)
+            call_command(
+                "refresh_trending_hashtags",
+                hours=options["days"] * 24,
+                stdout=self.stdout,
+            )
+            transaction.on_commit(lambda: invalidate("posts", "profiles"))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(users)} users, {len(posts)} posts, "
+                f"{Like.objects.count()} likes, {Comment.objects.count()} comments"
+            )
+        )
+
+    def batches(self, items: list):
+        # Keeps `__in` lookups under the query parameter limit
+        for start in range(0, len(items), self.batch_size):
+            yield items[start : start + self.batch_size]
+
+    def random_time(self):
+        return self.now - timedelta(seconds=self.random.uniform(0, self.period))
+
+    def popular_users(self, amount: int) -> list:
+        return self.random.choices(self.popular, cum_weights=self.popularity, k=amount)
+
+    def create_users(self, amount: int, password: str) -> list:
+        # Hashing once keeps seeding fast, every user gets the same password
+        password = make_password(password)
+        users = get_user_model().objects.bulk_create(
+            (
+                get_user_model()(
+                    email=f"user{index}@{EMAIL_DOMAIN}",
+                    username=f"{self.random.choice(WORDS)}_user{index}",
+                    password=password,
+                )
+                for index in range(amount)
+            ),
+            batch_size=self.batch_size,
+        )
+        UserProfile.objects.bulk_create(
+            (UserProfile(user=user, bio=f"Benchmark user {user.pk}") for user in users),
+            batch_size=self.batch_size,
+        )
+        for batch in self.batches(users):
+            index_users(batch)
+
+        return users
+
+    def create_follows(self, users: list, mean: int) -> None:
+        """Followers pick targets by popularity, so followers amount follows
+        a power law; followed amount per user is Pareto distributed"""
+        profile_ids = dict(UserProfile.objects.values_list("user_id", "id"))
+        follows = set()
+
+        for user in users:
+            amount = min(
+                len(users) - 1, round(self.random.paretovariate(1.5) * mean / 3)
+            )
+            follows.update(
+                (profile_ids[target.pk], user.pk)
+                for target in self.popular_users(amount)
+                if target.pk != user.pk
+            )
+
+        UserProfile.followed_by.through.objects.bulk_create(
+            (
+                UserProfile.followed_by.through(
+                    userprofile_id=profile_id, user_id=user_id
+                )
+                for profile_id, user_id in follows
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def create_posts(self, amount: int, hashtags: int, exponent: float) -> list:
+        hashtags = Hashtag.objects.get_or_create_many(
+            f"tag{index}" for index in range(hashtags)
+        )
+        hashtag_weights = power_law_weights(len(hashtags), exponent)
+        tags = [
+            self.random.choices(
+                hashtags, cum_weights=hashtag_weights, k=self.random.randint(0, 3)
+            )
+            for _ in range(amount)
+        ]
+
+        posts = [
+            Post(
+                user=author,
+                text_content=" ".join(
+                    self.random.choices(WORDS, k=self.random.randint(5, 30))
+                    + [f"#{hashtag.name}" for hashtag in post_tags]
+                ),
+            )
+            for author, post_tags in zip(self.popular_users(amount), tags)
+        ]
+        posts = Post.objects.bulk_create(posts, batch_size=self.batch_size)
+
+        # created_at is auto_now_add, so the spread is written afterwards
+        for post in posts:
+            post.created_at = self.random_time()
+        Post.objects.bulk_update(posts, ["created_at"], batch_size=self.batch_size)
+
+        Post.hashtags.through.objects.bulk_create(
+            (
+                Post.hashtags.through(post_id=post.pk, hashtag_id=hashtag.pk)
+                for post, post_tags in zip(posts, tags)
+                for hashtag in set(post_tags)
+            ),
+            batch_size=self.batch_size,
+        )
+
+        create_index()
+        for batch in self.batches(posts):
+            fan_out_posts(batch)
+            index_posts(batch)
+
+        return posts
+
+    def post_choices(self, posts: list, amount: int, exponent: float) -> list:
+        weights = power_law_weights(len(posts), exponent)
+        return self.random.choices(posts, cum_weights=weights, k=amount)
+
+    def create_likes(self, users: list, posts: list, amount: int, exponent) -> None:
+        Like.objects.bulk_create(
+            (
+                Like(post=post, user=self.random.choice(users))
+                for post in self.post_choices(posts, amount, exponent)
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+
+    def create_comments(self, users: list, posts: list, amount: int, exponent) -> None:
+        comments = Comment.objects.bulk_create(
+            (
+                Comment(
+                    post=post,
+                    user=self.random.choice(users),
+                    comment_contents=" ".join(
+                        self.random.choices(WORDS, k=self.random.randint(3, 15))
+                    ),
+                )
+                for post in self.post_choices(posts, amount, exponent)
+            ),
+            batch_size=self.batch_size,
+        )
+
+        for comment in comments:
+            comment.created_at = max(comment.post.created_at, self.random_time())
+        Comment.objects.bulk_update(
+            comments, ["created_at"], batch_size=self.batch_size
+        )
+        index_comments(comments)
@@ -1,22 +1,74 @@
 import os.path
-import uuid
+from collections import Counter, defaultdict
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+
+def normalize_hashtag(name: str) -> str:
+    return name.strip().lstrip("#").casefold()
+
+
+class HashtagManager(models.Manager):
+    def get_or_create_many(self, names) -> list["Hashtag"]:
+        """Resolve names to hashtags in input order, creating the missing ones.
+
+        Costs at most three queries regardless of the amount of names. Rows
+        inserted concurrently by other requests are skipped by the conflict
+        ignoring insert and picked up by the final select.
+        """
+        names = list(dict.fromkeys(filter(None, map(normalize_hashtag, names))))
+        if not names:
+            return []
+
+        hashtags = {hashtag.name: hashtag for hashtag in self.filter(name__in=names)}
+        missing = [name for name in names if name not in hashtags]
+
+        if missing:
+            self.bulk_create(
+                [self.model(name=name) for name in missing], ignore_conflicts=True
+            )
+            hashtags.update(
+                (hashtag.name, hashtag) for hashtag in self.filter(name__in=missing)
+            )
+
+        return [hashtags[name] for name in names]
 
 
 class Hashtag(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
+
+    objects = HashtagManager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name = normalize_hashtag(self.name)
 
-def post_image_file_path(instance, filename):
-    _, extension = os.path.splitext(filename)
+        super().save(*args, **kwargs)
+
+
+class TrendingHashtag(models.Model):
+    """Precomputed amount of recent posts per hashtag"""
+
+    hashtag = models.OneToOneField(
+        Hashtag, on_delete=models.CASCADE, related_name="trend"
+    )
+    posts_amount = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-posts_amount", "hashtag_id"]
+
+    def __str__(self):
+        return f"#{self.hashtag} in {self.posts_amount} recent posts"
 
-    filename = f"{instance.id}-{instance.user.id}-{uuid.uuid4()}{extension}"
 
+def post_image_file_path(instance, filename):
+    # The content addressed storage names the file after its hash
     return os.path.join("uploads", "post", filename)
 
 
@@ -26,6 +78,7 @@ class Post(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="posts"
     )
     image = models.ImageField(null=True, upload_to=post_image_file_path)
+    image_variants = models.JSONField(default=dict, blank=True)
     text_content = models.TextField()
     hashtags = models.ManyToManyField(
         "Hashtag",
@@ -33,7 +86,10 @@ class Post(models.Model):
         related_name="posts",
     )
     likes = models.ManyToManyField(
-        settings.AUTH_USER_MODEL, blank=True, related_name="liked_posts"
+        settings.AUTH_USER_MODEL,
+        through="Like",
+        blank=True,
+        related_name="liked_posts",
     )
     comments = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
@@ -41,13 +97,68 @@ class Post(models.Model):
         related_name="commented_posts",
         blank=True,
     )
+    likes_amount = models.PositiveIntegerField(default=0)
+    comments_amount = models.PositiveIntegerField(default=0)
 
     class Meta:
-        ordering = ["-created_at"]
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="post_created_idx"),
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="post_user_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Post by {self.user}. Posted {self.created_at}"
 
+    def is_liked_by(self, user) -> bool:
+        return Post.likes.through.objects.filter(
+            post_id=self.pk, user_id=user.pk
+        ).exists()
+
+    def add_like(self, user) -> bool:
+        """Insert a like row unless it exists; return whether it was added"""
+        try:
+            with transaction.atomic():
+                Post.likes.through.objects.create(post_id=self.pk, user_id=user.pk)
+        except IntegrityError:
+            return False
+
+        Post.objects.filter(pk=self.pk).update(likes_amount=F("likes_amount") + 1)
+        return True
+
+    def remove_like(self, user) -> bool:
+        """Delete a like row if it exists; return whether it was removed"""
+        deleted, _ = Post.likes.through.objects.filter(
+            post_id=self.pk, user_id=user.pk
+        ).delete()
+        if not deleted:
+            return False
+
+        # A counter that drifted to 0 stays there, reconcile_post_counters
+        # fixes it
+        Post.objects.filter(pk=self.pk, likes_amount__gt=0).update(
+            likes_amount=F("likes_amount") - 1
+        )
+        return True
+
+
+class Like(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    class Meta:
+        # Keeps the table of the former auto-created M2M through model
+        db_table = "social_media_post_likes"
+        constraints = [
+            models.UniqueConstraint(fields=["post", "user"], name="unique_post_like")
+        ]
+        indexes = [models.Index(fields=["post", "-id"], name="like_post_idx")]
+
+    def __str__(self):
+        return f"{self.user} likes {self.post_id}"
+
 
 class Comment(models.Model):
     user = models.ForeignKey(
@@ -59,5 +170,98 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     comment_contents = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="comment_user_created_idx",
+            ),
+            models.Index(
+                fields=["post", "created_at", "id"], name="comment_post_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user} posted {self.created_at}"
+
+
+class TimelineEntry(models.Model):
+    """Materialized home timeline row: `post` is shown in the feed of `owner`"""
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "post"], name="unique_timeline_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["owner", "-created_at", "-post"],
+                name="timeline_owner_created_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.post} in timeline of {self.owner}"
+
+
+class MediaBlobManager(models.Manager):
+    def _add_references(self, counts: Counter, sign: int) -> None:
+        by_amount = defaultdict(list)
+        for name, amount in counts.items():
+            by_amount[amount].append(name)
+        for amount, amount_names in by_amount.items():
+            self.filter(name__in=amount_names).update(
+                refs=F("refs") + sign * amount, updated_at=timezone.now()
+            )
+
+    def acquire(self, names) -> None:
+        """Take one reference per occurrence of a name"""
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+
+        with transaction.atomic():
+            # Locked rows can not be collected by gc_media before the update,
+            # rows it deleted meanwhile are created again
+            while True:
+                self.bulk_create(
+                    [MediaBlob(name=name) for name in counts], ignore_conflicts=True
+                )
+                locked = self.select_for_update().filter(name__in=counts)
+                if len(locked.values_list("pk", flat=True)) == len(counts):
+                    break
+            self._add_references(counts, 1)
+
+    def release(self, names) -> None:
+        """Drop references, unreferenced files are removed by `gc_media`"""
+        counts = Counter(name for name in names if name)
+        if counts:
+            self._add_references(counts, -1)
+
+
+class MediaBlob(models.Model):
+    """Reference count of a file of the content addressed media storage"""
+
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MediaBlobManager()
+
+    class Meta:
+        indexes = [models.Index(fields=["refs", "updated_at"], name="media_refs_idx")]
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
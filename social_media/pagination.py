@@ -0,0 +1,211 @@
+import json
+from datetime import datetime
+from functools import reduce
+from operator import attrgetter, or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Cursor pagination keyed on a unique combination of ordering fields.
+
+    DRF's CursorPagination stores only the first ordering field in the cursor
+    and skips ties with an offset. Here the cursor holds a value for every
+    field of `ordering`, so each page is a single range scan over the matching
+    composite index, however deep the client scrolls.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """Paginate querysets sharing the ordering fields as one sequence"""
+        querysets = self.get_page_querysets(querysets, request, view)
+        if querysets is None:
+            return None
+
+        return self.process_page(self.merge([list(queryset) for queryset in querysets]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return await self.apaginate_querysets([queryset], request, view)
+
+    async def apaginate_querysets(self, querysets, request, view=None):
+        """`paginate_querysets` fetching the pages with the async ORM"""
+        querysets = self.get_page_querysets(querysets, request, view)
+        if querysets is None:
+            return None
+
+        chunk_size = self.page_size + 1
+        parts = []
+        for queryset in querysets:
+            parts.append(
+                [row async for row in queryset.aiterator(chunk_size=chunk_size)]
+            )
+        return self.process_page(self.merge(parts))
+
+    def get_page_querysets(self, querysets, request, view=None):
+        """Filter and slice every queryset down to the rows of the requested page"""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.request = request
+        self.cursor = self.decode_cursor(request)
+
+        return [self.get_page_queryset(queryset) for queryset in querysets]
+
+    def get_page_queryset(self, queryset):
+        reverse = self.cursor is not None and self.cursor.reverse
+        if reverse:
+            queryset = queryset.order_by(*self._reversed_ordering())
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(
+                    self._position_filter(self.cursor.position, reverse)
+                )
+            except (ValidationError, TypeError, ValueError):
+                # Positions the fields can't hold, e.g. a tampered cursor
+                raise NotFound(self.invalid_cursor_message)
+
+        return queryset[: self.page_size + 1]
+
+    def merge(self, parts):
+        """Rows of the page out of the rows fetched from every queryset.
+
+        Each part holds its first `page_size + 1` rows past the cursor, so
+        together they hold the first `page_size + 1` of the combined
+        sequence. Rows found by several querysets are kept once.
+        """
+        if len(parts) == 1:
+            return parts[0]
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        rows = list({row.pk: row for part in parts for row in part}.values())
+        # Stable sorts from the last ordering field to the first
+        for field in reversed(ordering):
+            rows.sort(key=attrgetter(field.lstrip("-")), reverse=field.startswith("-"))
+
+        return rows[: self.page_size + 1]
+
+    def process_page(self, results):
+        """Compute navigation state for the rows fetched by `get_page_queryset`"""
+        reverse = self.cursor is not None and self.cursor.reverse
+        has_following = len(results) > self.page_size
+        self.page = results[: self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+
+        if self.page:
+            self.previous_position = self._get_position_from_instance(
+                self.page[0], self.ordering
+            )
+            self.next_position = self._get_position_from_instance(
+                self.page[-1], self.ordering
+            )
+        else:
+            self.previous_position = self.next_position = (
+                self.cursor.position if self.cursor else None
+            )
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.previous_position)
+        )
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        return super().encode_cursor(
+            cursor._replace(position=json.dumps(cursor.position))
+        )
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for field in ordering:
+            value = getattr(instance, field.lstrip("-"))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position.append(str(value))
+
+        return position
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith("-") else f"-{field}"
+            for field in self.ordering
+        ]
+
+    def _position_filter(self, position, reverse):
+        """Build `(f1, f2, ...) < (p1, p2, ...)` in the page direction"""
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            attr = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            lookup = "lt" if descending else "gt"
+
+            condition = Q(**{f"{attr}__{lookup}": position[index]})
+            for previous, value in zip(self.ordering[:index], position):
+                condition &= Q(**{previous.lstrip("-"): value})
+
+            conditions.append(condition)
+
+        return reduce(or_, conditions)
+
+
+class CommentThreadPagination(KeysetCursorPagination):
+    ordering = ("created_at", "id")
+
+
+class TimelinePagination(KeysetCursorPagination):
+    """Pagination of `timeline_querysets`"""
+
+    ordering = ("-timeline_created_at", "-timeline_post_id")
+
+
+class LikeCursorPagination(KeysetCursorPagination):
+    ordering = ("-id",)
@@ -0,0 +1,221 @@
+"""Full-text index over post and comment contents.
+
+Documents live in the `social_media_search` table, an FTS5 virtual table on
+SQLite and a table with a GIN-indexed tsvector column on PostgreSQL. The
+table is created after migrations and kept in sync by model signals.
+Document ids encode the source row: `id * 2` for posts, `id * 2 + 1` for
+comments.
+"""
+import re
+
+from django.db import connection
+
+from .models import Comment, Post
+
+TABLE = "social_media_search"
+
+POST, COMMENT = "post", "comment"
+
+
+def post_document_id(post_id: int) -> int:
+    return post_id * 2
+
+
+def comment_document_id(comment_id: int) -> int:
+    return comment_id * 2 + 1
+
+
+def parse_document_id(document_id: int) -> tuple[str, int]:
+    return (COMMENT if document_id % 2 else POST), document_id // 2
+
+
+class SQLiteSearchBackend:
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            "body, post_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+    def index(self, cursor, documents):
+        self.remove(cursor, [document_id for document_id, _, _ in documents])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, post_id, body) VALUES (%s, %s, %s)",
+            documents,
+        )
+
+    def remove(self, cursor, document_ids):
+        cursor.executemany(
+            f"DELETE FROM {TABLE} WHERE rowid = %s",
+            [(document_id,) for document_id in document_ids],
+        )
+
+    def search(self, cursor, terms, after, limit):
+        # bm25 rank is negative, lower is better
+        match = " ".join(f'"{term}"' for term in terms)
+        query = (
+            f"SELECT rowid, post_id, body, rank FROM {TABLE} " f"WHERE {TABLE} MATCH %s"
+        )
+        params = [match]
+        if after is not None:
+            query += " AND (rank > %s OR (rank = %s AND rowid > %s))"
+            params += [after[0], after[0], after[1]]
+
+        cursor.execute(query + " ORDER BY rank, rowid LIMIT %s", params + [limit])
+        return cursor.fetchall()
+
+
+class PostgresSearchBackend:
+    def create_index(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            "id bigint PRIMARY KEY, post_id bigint NOT NULL, body text NOT NULL, "
+            "document tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple', body)) STORED)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx "
+            f"ON {TABLE} USING GIN (document)"
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {TABLE}")
+
+    def index(self, cursor, documents):
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (id, post_id, body) VALUES (%s, %s, %s) "
+            "ON CONFLICT (id) DO UPDATE "
+            "SET post_id = EXCLUDED.post_id, body = EXCLUDED.body",
+            documents,
+        )
+
+    def remove(self, cursor, document_ids):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE id = ANY(%s)", [document_ids])
+
+    def search(self, cursor, terms, after, limit):
+        # Negated so that, as on SQLite, a lower score is a better match
+        query = (
+            "SELECT id, post_id, body, score FROM ("
+            "SELECT id, post_id, body, -ts_rank(document, query) AS score "
+            f"FROM {TABLE}, plainto_tsquery('simple', %s) query "
+            "WHERE document @@ query) ranked"
+        )
+        params = [" ".join(terms)]
+        if after is not None:
+            query += " WHERE score > %s OR (score = %s AND id > %s)"
+            params += [after[0], after[0], after[1]]
+
+        cursor.execute(query + " ORDER BY score, id LIMIT %s", params + [limit])
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_backend(db=connection):
+    backend_class = BACKENDS.get(db.vendor)
+    return backend_class() if backend_class else None
+
+
+def create_index(db=connection) -> None:
+    backend = get_backend(db)
+    if backend:
+        with db.cursor() as cursor:
+            backend.create_index(cursor)
+
+
+def index_documents(documents) -> None:
+    """Add or replace `(document_id, post_id, body)` rows"""
+    backend = get_backend()
+    if backend and documents:
+        with connection.cursor() as cursor:
+            backend.index(cursor, documents)
+
+
+def remove_documents(document_ids) -> None:
+    backend = get_backend()
+    if backend and document_ids:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, document_ids)
+
+
+def index_posts(posts) -> None:
+    index_documents(
+        [(post_document_id(post.id), post.id, post.text_content) for post in posts]
+    )
+
+
+def index_comments(comments) -> None:
+    index_documents(
+        [
+            (comment_document_id(comment.id), comment.post_id, comment.comment_contents)
+            for comment in comments
+        ]
+    )
+
+
+def clear_index() -> None:
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.clear(cursor)
+
+
+def search_terms(query: str) -> list[str]:
+    """Split free text into words, dropping any query syntax"""
+    return re.findall(r"\w+", query.casefold())
+
+
+def search(query: str, after=None, limit=20) -> list[dict]:
+    """Ranked matches for `query`, best first, starting after `(score, id)`"""
+    backend = get_backend()
+    terms = search_terms(query)
+    if backend is None or not terms:
+        return []
+
+    with connection.cursor() as cursor:
+        rows = backend.search(cursor, terms, after, limit)
+
+    results = []
+    for document_id, post_id, body, score in rows:
+        kind, object_id = parse_document_id(document_id)
+        results.append(
+            {
+                "type": kind,
+                "id": object_id,
+                "post": post_id,
+                "text": body,
+                "score": score,
+                "document_id": document_id,
+            }
+        )
+    return results
+
+
+def rebuild_index(batch_size=1000, stdout=None) -> int:
+    """Reindex every post and comment in primary key ordered batches"""
+    clear_index()
+    indexed = 0
+
+    for model, fields, index in (
+        (Post, ("id", "text_content"), index_posts),
+        (Comment, ("id", "post_id", "comment_contents"), index_comments),
+    ):
+        last_id = 0
+        while batch := list(
+            model.objects.filter(pk__gt=last_id)
+            .order_by("pk")
+            .only(*fields)[:batch_size]
+        ):
+            index(batch)
+            last_id = batch[-1].pk
+            indexed += len(batch)
+            if stdout:
+                stdout.write(f"Indexed {indexed} documents")
+
+    return indexed
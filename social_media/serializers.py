@@ -1,7 +1,42 @@
+from django.core.files.storage import default_storage
 from django.db import transaction
 from rest_framework import serializers
 
-from .models import Hashtag, Post, Comment
+from .images import ORIGINAL
+from .models import (
+    Hashtag,
+    Post,
+    Comment,
+    Like,
+    TrendingHashtag,
+    normalize_hashtag,
+)
+
+
+class ImageVariantsField(serializers.Field):
+    """URLs of the resized variants of `image_field`, read from
+    `<image_field>_variants`. Empty until the upload is processed"""
+
+    def __init__(self, image_field: str, **kwargs):
+        self.image_field = image_field
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        image = getattr(instance, self.image_field)
+        variants = getattr(instance, f"{self.image_field}_variants")
+        if not image or image.name != variants.get(ORIGINAL):
+            return {}
+
+        request = self.context.get("request")
+        urls = {}
+        for name, path in variants.items():
+            if name == ORIGINAL:
+                continue
+            url = default_storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -32,6 +67,22 @@ class HashtagSerializer(serializers.ModelSerializer):
             "id",
             "name",
         )
+        # Existing hashtags are reused when nested into a post
+        extra_kwargs = {"name": {"validators": []}}
+
+    def validate_name(self, value):
+        value = normalize_hashtag(value)
+        if not value:
+            raise serializers.ValidationError("Hashtag can not be empty.")
+        return value
+
+
+class TrendingHashtagSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source="hashtag.name", read_only=True)
+
+    class Meta:
+        model = TrendingHashtag
+        fields = ("name", "posts_amount")
 
 
 class PostSerializer(serializers.ModelSerializer):
@@ -50,11 +101,14 @@ class PostSerializer(serializers.ModelSerializer):
 
 
 class PostImageSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField("image")
+
     class Meta:
         model = Post
         fields = (
             "id",
             "image",
+            "image_variants",
         )
 
 
@@ -62,8 +116,7 @@ class PostListSerializer(PostSerializer):
     hashtags = serializers.SlugRelatedField(
         many=True, read_only=True, slug_field="name"
     )
-    likes_amount = serializers.IntegerField()
-    comments_amount = serializers.IntegerField()
+    image_variants = ImageVariantsField("image")
 
     class Meta:
         model = Post
@@ -72,26 +125,56 @@ class PostListSerializer(PostSerializer):
             "created_at",
             "user",
             "image",
+            "image_variants",
             "text_content",
             "hashtags",
             "likes_amount",
             "comments_amount",
         )
+        read_only_fields = ("likes_amount", "comments_amount")
 
 
 class PostDetailSerializer(PostSerializer):
-    comments = CommentSerializer(source="post_comments", many=True, read_only=True)
-    likes = serializers.SlugRelatedField(
-        many=True, read_only=True, slug_field="username"
-    )
+    """Embeds only the first comments, the rest are served by
+    the paginated comments endpoint"""
+
+    comments = CommentSerializer(source="first_comments", many=True, read_only=True)
+    image_variants = ImageVariantsField("image")
+
+    class Meta:
+        model = Post
+        fields = (
+            "id",
+            "created_at",
+            "user",
+            "image",
+            "image_variants",
+            "text_content",
+            "hashtags",
+            "likes_amount",
+            "comments_amount",
+            "comments",
+        )
+        read_only_fields = ("likes_amount", "comments_amount")
+
+
+class LikeSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source="user.username", read_only=True)
+
+    class Meta:
+        model = Like
+        fields = ("user", "username")
 
 
 class PostLikeSerializer(serializers.ModelSerializer):
-    like = serializers.BooleanField()
+    """Omitting `like` toggles the current state"""
+
+    like = serializers.BooleanField(required=False, allow_null=True)
 
     class Meta:
         model = Post
-        fields = ("like",)
+        fields = ("like", "likes_amount")
+        read_only_fields = ("likes_amount",)
 
 
 class PostHashtagSerializer(serializers.ModelSerializer):
@@ -117,11 +200,10 @@ class PostHashtagSerializer(serializers.ModelSerializer):
             hashtags_data = validated_data.pop("hashtags")
             post = Post.objects.create(**validated_data)
             if hashtags_data:
-                hashtags = [
-                    Hashtag.objects.get_or_create(name=tag["name"])[0]
-                    for tag in hashtags_data
-                ]
-                post.hashtags.set(hashtags)
+                hashtags = Hashtag.objects.get_or_create_many(
+                    tag["name"] for tag in hashtags_data
+                )
+                post.hashtags.add(*hashtags)
             return post
 
 
@@ -146,10 +228,16 @@ class PostUpdateSerializer(PostHashtagSerializer):
             instance.save()
 
             if hashtags_data:
-                hashtags = [
-                    Hashtag.objects.get_or_create(name=tag["name"])[0]
-                    for tag in hashtags_data
-                ]
+                hashtags = Hashtag.objects.get_or_create_many(
+                    tag["name"] for tag in hashtags_data
+                )
                 instance.hashtags.set(hashtags)
 
         return instance
+
+
+class SearchResultSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=["post", "comment"])
+    id = serializers.IntegerField()
+    post = serializers.IntegerField()
+    text = serializers.CharField()
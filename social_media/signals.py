@@ -0,0 +1,67 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from social_media_api.tasks import enqueue
+from . import search
+from .cache import invalidate
+from .images import ORIGINAL, held_media
+from .models import Comment, Hashtag, Like, MediaBlob, Post
+from .tasks import process_post_image
+from .timeline import fan_out_post
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Hashtag)
+@receiver(post_delete, sender=Hashtag)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_post_responses(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate("posts"))
+
+
+@receiver(post_save, sender=Post)
+def schedule_post_image_processing(sender, instance, **kwargs):
+    # Processed images are stored under the name of their stripped original
+    if instance.image and instance.image.name != instance.image_variants.get(ORIGINAL):
+        enqueue(process_post_image, instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    MediaBlob.objects.release(held_media(instance.image.name, instance.image_variants))
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_posts([instance])
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    search.index_comments([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_documents([search.post_document_id(instance.id)])
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.remove_documents([search.comment_document_id(instance.id)])
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    if sender.name == "social_media":
+        search.create_index(connections[using])
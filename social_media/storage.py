@@ -0,0 +1,64 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+from .models import MediaBlob
+
+TEMP_PREFIX = ".upload-"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming every file after the SHA-256 of its contents.
+
+    The directory of the requested name is kept and the base name becomes
+    `<sha256><extension>`, so saving the same bytes twice returns the existing
+    file instead of writing a copy. Contents are streamed chunk by chunk into
+    a temporary file while hashing. Each save takes a `MediaBlob` reference,
+    files without references are removed by `manage.py gc_media`.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from contents in `_save`, a taken name is a duplicate
+        return name
+
+    def _save(self, name, content):
+        directory, basename = os.path.split(name)
+        _, extension = os.path.splitext(basename)
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        descriptor, temp_path = tempfile.mkstemp(dir=full_directory, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+
+            name = os.path.join(directory, f"{digest.hexdigest()}{extension.lower()}")
+            full_path = self.path(name)
+            name = name.replace("\\", "/")
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        # Referenced before the file is looked for: gc_media either sees the
+        # reference, or it removed the row and the file before `acquire`
+        # returned and the file is stored again
+        MediaBlob.objects.acquire([name])
+        try:
+            if os.path.exists(full_path):
+                os.remove(temp_path)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            MediaBlob.objects.release([name])
+            raise
+
+        return name
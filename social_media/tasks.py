@@ -0,0 +1,49 @@
+from user.models import UserProfile
+from .cache import invalidate
+from .images import ORIGINAL, build_variants, held_media
+from .models import MediaBlob, Post
+
+
+def process_post_image(post_id: int) -> None:
+    """Replace the raw upload of a post with a stripped copy plus variants"""
+    post = Post.objects.filter(pk=post_id).only("id", "image", "image_variants").first()
+    if post is None or not post.image:
+        return
+
+    source = post.image.name
+    variants = build_variants(post.image, "uploads/post")
+
+    # Skip the update if the image was replaced while processing
+    updated = Post.objects.filter(pk=post_id, image=source).update(
+        image=variants[ORIGINAL], image_variants=variants
+    )
+    if updated:
+        MediaBlob.objects.release(held_media(post.image.name, post.image_variants))
+    else:
+        MediaBlob.objects.release(variants.values())
+    invalidate("posts")
+
+
+def process_profile_picture(profile_id: int) -> None:
+    """Replace the raw profile picture with a stripped copy plus variants"""
+    profile = (
+        UserProfile.objects.filter(pk=profile_id)
+        .only("id", "profile_picture", "profile_picture_variants")
+        .first()
+    )
+    if profile is None or not profile.profile_picture:
+        return
+
+    source = profile.profile_picture.name
+    variants = build_variants(profile.profile_picture, "uploads/profile_pictures")
+
+    updated = UserProfile.objects.filter(pk=profile_id, profile_picture=source).update(
+        profile_picture=variants[ORIGINAL], profile_picture_variants=variants
+    )
+    if updated:
+        MediaBlob.objects.release(
+            held_media(profile.profile_picture.name, profile.profile_picture_variants)
+        )
+    else:
+        MediaBlob.objects.release(variants.values())
+    invalidate("profiles")
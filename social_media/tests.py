@@ -1,3 +1,915 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from io import BytesIO, StringIO
+import time
+from unittest import mock
+from base64 import b64encode
+from datetime import timedelta
+from urllib.parse import quote, urlencode, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from social_media import images, search
+from social_media.cache import get_or_compute
+from social_media.images import ORIGINAL
+from social_media.management.commands.gc_media import Command as GCMediaCommand
+from social_media.models import (
+    Comment,
+    Hashtag,
+    Like,
+    MediaBlob,
+    Post,
+    TimelineEntry,
+)
+from social_media.tasks import process_post_image, process_profile_picture
+from social_media_api.testing import QueryBudgetMixin
+from user.models import User, UserProfile
+
+
+def create_user(name: str) -> User:
+    user = User.objects.create_user(
+        email=f"{name}@example.com", password="password", username=name
+    )
+    UserProfile.objects.create(user=user, bio=f"Bio of {name}")
+    return user
+
+
+def walk(client, url: str) -> tuple[list, list]:
+    """Post ids of every page following `next`, then of every page back"""
+    forward = []
+    while url:
+        response = client.get(url)
+        forward.extend(post["id"] for post in response.data["results"])
+        last = response.data
+        url = last["next"]
+
+    backward = [post["id"] for post in last["results"]]
+    url = last["previous"]
+    while url:
+        response = client.get(url)
+        backward[:0] = [post["id"] for post in response.data["results"]]
+        url = response.data["previous"]
+
+    return forward, backward
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user("author")
+        self.client = APIClient()
+
+    def create_posts(self, user, times) -> None:
+        for created_at in times:
+            post = Post.objects.create(user=user, text_content="Post")
+            Post.objects.filter(pk=post.pk).update(created_at=created_at)
+
+    def test_ties_across_page_boundaries(self):
+        now = timezone.now()
+        # Pages of 3 split every group of equal timestamps
+        self.create_posts(self.author, [now] * 4 + [now - timedelta(hours=1)] * 4)
+        expected = list(
+            Post.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+
+        forward, backward = walk(self.client, "/api/posts/?page_size=3")
+
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_empty_and_last_page(self):
+        response = self.client.get("/api/posts/")
+        self.assertEqual(response.data["results"], [])
+        self.assertIsNone(response.data["next"])
+
+        self.create_posts(self.author, [timezone.now()] * 2)
+        response = self.client.get("/api/posts/?page_size=2")
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+        self.assertIsNone(response.data["previous"])
+
+    def test_invalid_cursor(self):
+        for cursor in ["garbage", "cD1bMV0%3D", "cD0x"]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f"/api/posts/?cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor_positions(self):
+        self.create_posts(self.author, [timezone.now()])
+        positions = [
+            ["yesterday", "1"],
+            [timezone.now().isoformat(), "one"],
+            [None, None],
+            [[1], {"id": 1}],
+        ]
+        for position in positions:
+            with self.subTest(position=position):
+                query = urlencode({"r": 1, "p": json.dumps(position)})
+                cursor = quote(b64encode(query.encode()).decode())
+                response = self.client.get(f"/api/posts/?cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+
+    def test_feed_merges_fan_out_on_read_authors(self):
+        reader = create_user("reader")
+        celebrity = create_user("celebrity")
+        for profile in (self.author.profile, celebrity.profile):
+            profile.add_follower(reader)
+        now = timezone.now()
+        times = [now - timedelta(minutes=minute % 3) for minute in range(6)]
+        self.create_posts(self.author, times)
+        self.create_posts(celebrity, times)
+        self.create_posts(reader, times[:2])
+        TimelineEntry.objects.all().delete()
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(owner=reader, post=post, created_at=post.created_at)
+            for post in Post.objects.exclude(user=reader)
+        )
+        # Earlier posts of an author switched to fan-out-on-read stay in the
+        # timeline, the feed shows them once
+        UserProfile.objects.filter(user=celebrity).update(fan_out_on_read=True)
+        TimelineEntry.objects.filter(
+            post__in=Post.objects.filter(user=celebrity).order_by("id")[:3]
+        ).delete()
+        expected = list(
+            Post.objects.exclude(user=reader)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+
+        self.client.force_authenticate(reader)
+        forward, backward = walk(self.client, "/api/posts/?page_size=4")
+
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+
+@override_settings(TIMELINE_BACKFILL_SIZE=2)
+class FollowedPostLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user("author")
+        self.reader = create_user("reader")
+        self.posts = [
+            Post.objects.create(user=self.author, text_content=f"Post {number}")
+            for number in range(4)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.client.post(f"/user/profiles/{self.author.profile.id}/follow-user/")
+
+    def test_posts_older_than_the_backfill_are_reachable(self):
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader).count(), 2)
+        for post in self.posts:
+            url = f"/api/posts/{post.id}/"
+            with self.subTest(post=post.text_content):
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertEqual(self.client.get(f"{url}comments/").status_code, 200)
+                self.assertEqual(self.client.get(f"{url}likes/").status_code, 200)
+                self.assertEqual(self.client.post(f"{url}like/").status_code, 200)
+                response = self.client.post(
+                    f"{url}comment/", {"comment_contents": "Hi"}
+                )
+                self.assertEqual(response.status_code, 200)
+
+    async def test_async_detail(self):
+        token = AccessToken.for_user(self.reader)
+        client = AsyncClient(headers={"Authorization": f"Bearer {token}"})
+        for post in self.posts:
+            with self.subTest(post=post.text_content):
+                response = await client.get(f"/api/async/posts/{post.id}/")
+                self.assertEqual(response.status_code, 200)
+
+    def test_unfollowed_posts_are_not_reachable(self):
+        other = Post.objects.create(user=create_user("other"), text_content="Other")
+        response = self.client.get(f"/api/posts/{other.id}/")
+        self.assertEqual(response.status_code, 404)
+
+
+class ResponseCacheTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user("author")
+        self.reader = create_user("reader")
+        self.author.profile.add_follower(self.reader)
+        self.post = Post.objects.create(user=self.author, text_content="First")
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.reader_client = APIClient()
+        self.reader_client.force_authenticate(self.reader)
+
+    def post_ids(self) -> list:
+        return [
+            post["id"] for post in self.anonymous.get("/api/posts/").data["results"]
+        ]
+
+    def followers(self) -> dict:
+        profiles = self.anonymous.get("/user/profiles/").data["results"]
+        return {profile["user"]: profile["followers_amount"] for profile in profiles}
+
+    def write(self, method: str, url: str, data=None, client=None):
+        client = client or self.client
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, method)(url, data, format="json")
+        self.assertLess(response.status_code, 400, response.data)
+        return response
+
+    def test_anonymous_responses_are_cached(self):
+        self.assertEqual(self.post_ids(), [self.post.id])
+        # Written without signals, so the cached payload stays
+        Post.objects.filter(pk=self.post.pk).update(text_content="Changed")
+
+        response = self.assertQueryBudget(0, self.anonymous.get, "/api/posts/")
+        self.assertEqual(response.data["results"][0]["text_content"], "First")
+
+    def test_authenticated_responses_are_not_cached(self):
+        self.reader_client.get(f"/api/posts/{self.post.id}/")
+        Post.objects.filter(pk=self.post.pk).update(text_content="Changed")
+
+        response = self.reader_client.get(f"/api/posts/{self.post.id}/")
+        self.assertEqual(response.data["text_content"], "Changed")
+
+    def test_post_writes_invalidate(self):
+        self.assertEqual(self.post_ids(), [self.post.id])
+
+        created = self.write(
+            "post", "/api/my-posts/", {"text_content": "Second", "hashtags": []}
+        )
+        self.assertEqual(self.post_ids(), [created.data["id"], self.post.id])
+
+        self.write("patch", f"/api/my-posts/{self.post.id}/", {"text_content": "Edit"})
+        detail = self.anonymous.get(f"/api/posts/{self.post.id}/")
+        self.assertEqual(detail.data["text_content"], "Edit")
+
+        self.write("delete", f"/api/my-posts/{self.post.id}/")
+        self.assertEqual(self.post_ids(), [created.data["id"]])
+
+    def test_comments_invalidate_post_detail(self):
+        url = f"/api/posts/{self.post.id}/"
+        self.assertEqual(self.anonymous.get(url).data["comments"], [])
+
+        self.write(
+            "post", f"{url}comment/", {"comment_contents": "Hi"}, self.reader_client
+        )
+
+        comments = self.anonymous.get(url).data["comments"]
+        self.assertEqual([comment["comment_contents"] for comment in comments], ["Hi"])
+
+    def test_profile_writes_invalidate(self):
+        url = f"/user/profiles/{self.author.profile.id}/"
+        self.assertEqual(self.anonymous.get(url).data["bio"], "Bio of author")
+
+        self.write(
+            "patch", f"/user/my-profile/{self.author.profile.id}/", {"bio": "New"}
+        )
+
+        self.assertEqual(self.anonymous.get(url).data["bio"], "New")
+
+    def test_likes_and_follows_invalidate(self):
+        self.assertEqual(
+            self.anonymous.get("/api/posts/").data["results"][0]["likes_amount"], 0
+        )
+        self.assertEqual(self.followers(), {"author": 1, "reader": 0})
+
+        self.write(
+            "post", f"/api/posts/{self.post.id}/like/", client=self.reader_client
+        )
+        self.write("post", f"/user/profiles/{self.reader.profile.id}/follow-user/")
+
+        self.assertEqual(
+            self.anonymous.get("/api/posts/").data["results"][0]["likes_amount"], 1
+        )
+        self.assertEqual(self.followers(), {"author": 1, "reader": 1})
+
+    @override_settings(RESPONSE_CACHE_LOCK_TIMEOUT=5)
+    def test_waiters_do_not_wait_for_uncacheable_values(self):
+        def compute():
+            time.sleep(0.1)
+            return "not found", False
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(get_or_compute("key", compute, 30))
+            )
+            for _ in range(3)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["not found"] * 3)
+        self.assertLess(time.monotonic() - started, 2)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("reader")
+        self.author = create_user("author")
+        self.author.profile.add_follower(self.user)
+        self.post = Post.objects.create(user=self.author, text_content="Post")
+        self.own_post = Post.objects.create(user=self.user, text_content="Own")
+        self.added = 0
+        self.add_rows()
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_rows(self):
+        """More posts, likes, comments, hashtags and followers"""
+        for _ in range(5):
+            self.added += 1
+            other = create_user(f"other{self.added}")
+            post = Post.objects.create(user=self.author, text_content="More")
+            post.hashtags.add(*Hashtag.objects.get_or_create_many([f"tag{self.added}"]))
+            for target in (self.post, self.own_post, post):
+                target.add_like(other)
+                Comment.objects.create(user=other, post=target, comment_contents="Hi")
+            self.own_post.add_like(self.user)
+            self.author.profile.add_follower(other)
+            Comment.objects.create(user=self.user, post=post, comment_contents="Hi")
+
+    def get(self, url):
+        def request():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+        return request
+
+    def test_post_endpoints(self):
+        for url in [
+            "/api/posts/",
+            f"/api/posts/{self.post.id}/",
+            f"/api/posts/{self.post.id}/comments/",
+            f"/api/posts/{self.post.id}/likes/",
+            "/api/posts/liked-posts/",
+            "/api/my-posts/",
+            f"/api/my-posts/{self.own_post.id}/",
+            "/api/comments/",
+        ]:
+            with self.subTest(url=url):
+                self.assertConstantQueries(self.get(url), self.add_rows, budget=8)
+
+    def test_detail_budget(self):
+        for url in [
+            f"/api/posts/{self.post.id}/",
+            f"/api/my-posts/{self.own_post.id}/",
+        ]:
+            with self.subTest(url=url):
+                self.assertQueryBudget(5, self.get(url))
+
+    def test_profile_endpoints(self):
+        for url in [
+            "/user/profiles/",
+            f"/user/profiles/{self.author.profile.id}/",
+            "/user/profiles/following/",
+            "/user/my-profile/",
+            "/user/my-profile/followers/",
+        ]:
+            with self.subTest(url=url):
+                self.assertConstantQueries(self.get(url), self.add_rows, budget=8)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user = create_user("reader")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.token = self.client.post("/api/stream/token/").data["token"]
+
+    def test_wsgi_is_refused(self):
+        self.assertEqual(self.client.get("/api/stream/").status_code, 501)
+
+    async def test_query_string_token(self):
+        response = await AsyncClient().get(f"/api/stream/?token={self.token}")
+        self.assertEqual(response.status_code, 200)
+        content = aiter(response.streaming_content)
+        self.assertTrue((await anext(content)).startswith(b"retry:"))
+        await content.aclose()
+
+    async def test_invalid_query_string_tokens(self):
+        # Stream tokens are no access tokens, and the other way around
+        access = str(AccessToken.for_user(self.user))
+        for token in ["garbage", access]:
+            with self.subTest(token=token):
+                response = await AsyncClient().get(f"/api/stream/?token={token}")
+                self.assertEqual(response.status_code, 401)
+
+        response = await AsyncClient().get(
+            "/api/posts/", headers={"Authorization": f"Bearer {self.token}"}
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+def without_host(data: dict) -> dict:
+    """Paginated payload with links reduced to their query string"""
+    links = {
+        key: data[key] and urlsplit(data[key]).query for key in ["next", "previous"]
+    }
+    return {**data, **links}
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = create_user("reader")
+        self.author = create_user("author")
+        self.stranger = create_user("stranger")
+        self.author.profile.add_follower(self.reader)
+        for user in [self.author, self.stranger] * 3:
+            post = Post.objects.create(user=user, text_content=f"Post of {user}")
+            post.hashtags.add(Hashtag.objects.get_or_create(name="cats")[0])
+            Comment.objects.create(post=post, user=self.reader, comment_contents="Nice")
+        self.post = Post.objects.filter(user=self.author).first()
+        Like.objects.create(post=self.post, user=self.reader)
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.reader)}"}
+
+    def get(self, url: str, headers=None) -> tuple:
+        """Responses of the sync view and of its async twin"""
+        sync = APIClient(headers=headers).get(url)
+        async_url = url.replace("/api/", "/api/async/", 1)
+        # AsyncClient ignores client-wide headers
+        asynchronous = async_to_sync(AsyncClient().get)(async_url, headers=headers)
+        return sync, asynchronous
+
+    def assertSamePayload(self, url: str, headers=None, paginated=True):
+        sync, asynchronous = self.get(url, headers)
+        self.assertEqual(asynchronous.status_code, 200)
+        self.assertEqual(sync.status_code, 200)
+        if paginated:
+            self.assertEqual(
+                without_host(asynchronous.json()), without_host(sync.json())
+            )
+        else:
+            self.assertEqual(asynchronous.json(), sync.json())
+
+    def test_feed_payloads(self):
+        for headers in [None, self.headers]:
+            for url in ["/api/posts/?page_size=2", "/api/posts/?hashtags=cats"]:
+                with self.subTest(url=url, headers=headers):
+                    self.assertSamePayload(url, headers)
+
+        cursor = self.get("/api/posts/?page_size=2", self.headers)[0].data["next"]
+        self.assertSamePayload(cursor.replace("http://testserver", ""), self.headers)
+
+    def test_post_detail_payloads(self):
+        url = f"/api/posts/{self.post.id}/"
+        for headers in [None, self.headers]:
+            with self.subTest(headers=headers):
+                self.assertSamePayload(url, headers, paginated=False)
+
+    def test_missing_posts(self):
+        hidden = Post.objects.filter(user=self.stranger).first()
+        for url, headers in [
+            ("/api/posts/0/", None),
+            (f"/api/posts/{hidden.id}/", self.headers),
+        ]:
+            with self.subTest(url=url):
+                sync, asynchronous = self.get(url, headers)
+                self.assertEqual(sync.status_code, 404)
+                self.assertEqual(asynchronous.status_code, 404)
+                self.assertEqual(asynchronous.json(), sync.json())
+
+    def test_invalid_tokens(self):
+        stream_token = APIClient(headers=self.headers).post("/api/stream/token/")
+        for token in ["garbage", stream_token.data["token"]]:
+            with self.subTest(token=token):
+                sync, asynchronous = self.get(
+                    "/api/posts/", {"Authorization": f"Bearer {token}"}
+                )
+                self.assertEqual(sync.status_code, 401)
+                self.assertEqual(asynchronous.status_code, 401)
+                self.assertEqual(asynchronous.json(), sync.json())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = create_user("author")
+        self.client = APIClient()
+
+    def matches(self, query: str) -> list:
+        return [(result["type"], result["id"]) for result in search.search(query)]
+
+    def test_index_is_created_after_migrations(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {search.TABLE}")
+
+        emit_post_migrate_signal(verbosity=0, interactive=False, db="default")
+
+        self.assertIn(search.TABLE, connection.introspection.table_names())
+
+    def test_signals_keep_the_index_in_sync(self):
+        post = Post.objects.create(user=self.author, text_content="Fresh bread")
+        comment = Comment.objects.create(
+            user=self.author, post=post, comment_contents="Bread is great"
+        )
+        self.assertEqual(
+            sorted(self.matches("bread")), [("comment", comment.id), ("post", post.id)]
+        )
+
+        post.text_content = "Fresh cheese"
+        post.save()
+        self.assertEqual(self.matches("bread"), [("comment", comment.id)])
+        self.assertEqual(self.matches("cheese"), [("post", post.id)])
+
+        comment.delete()
+        post.delete()
+        self.assertEqual(self.matches("bread cheese"), [])
+
+    def test_ranking(self):
+        long = Post.objects.create(
+            user=self.author, text_content="A cat, a dog, a bird and a horse"
+        )
+        short = Post.objects.create(user=self.author, text_content="Cat")
+        Post.objects.create(user=self.author, text_content="Dog")
+
+        self.assertEqual(self.matches("cat"), [("post", short.id), ("post", long.id)])
+        # Every word has to match
+        self.assertEqual(self.matches("cat dog"), [("post", long.id)])
+        # Query syntax is searched as plain words
+        self.assertEqual(self.matches('"cat* -dog'), [("post", long.id)])
+
+    def test_cursor_pages(self):
+        posts = [
+            Post.objects.create(user=self.author, text_content="word " * number)
+            for number in range(1, 26)
+        ]
+
+        found, url = [], "/api/search/?q=word"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            found.extend(result["id"] for result in response.data["results"])
+            url = response.data["next"]
+
+        self.assertEqual(sorted(found), [post.id for post in posts])
+        response = self.client.get("/api/search/?q=word&cursor=garbage")
+        self.assertEqual(response.status_code, 404)
+
+    def test_rebuild_search_index(self):
+        post = Post.objects.create(user=self.author, text_content="Rebuilt")
+        Comment.objects.create(user=self.author, post=post, comment_contents="Too")
+        search.clear_index()
+        self.assertEqual(self.matches("rebuilt too"), [])
+
+        out = StringIO()
+        call_command("rebuild_search_index", batch_size=1, stdout=out)
+
+        self.assertIn("Indexed 2 documents", out.getvalue())
+        self.assertEqual(self.matches("rebuilt"), [("post", post.id)])
+        self.assertEqual(len(self.matches("too")), 1)
+
+
+class TemporaryMediaMixin:
+    """Runs each test with an empty MEDIA_ROOT and inline tasks"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        media_settings = override_settings(
+            MEDIA_ROOT=self.media_root, TASKS_BACKEND="sync"
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def files(self, directory="uploads") -> list:
+        found = []
+        for path, _, names in os.walk(os.path.join(self.media_root, directory)):
+            found += [os.path.join(path, name) for name in names]
+        return found
+
+
+class MediaStorageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = create_user("author")
+
+    def save(self, data=b"contents", name="uploads/post/photo.PNG") -> str:
+        return default_storage.save(name, ContentFile(data))
+
+    def refs(self, name: str):
+        return (
+            MediaBlob.objects.filter(name=name).values_list("refs", flat=True).first()
+        )
+
+    def gc(self, *args) -> str:
+        out = StringIO()
+        call_command("gc_media", *args, stdout=out)
+        return out.getvalue()
+
+    def test_identical_contents_are_stored_once(self):
+        first, second = self.save(), self.save()
+        other = self.save(b"other contents")
+
+        digest = hashlib.sha256(b"contents").hexdigest()
+        self.assertEqual(first, f"uploads/post/{digest}.png")
+        self.assertEqual(second, first)
+        self.assertNotEqual(other, first)
+        self.assertEqual(len(self.files()), 2)
+        self.assertEqual(self.refs(first), 2)
+
+    def test_deleting_posts_releases_references(self):
+        name = self.save()
+        posts = [
+            Post.objects.create(
+                user=self.author,
+                text_content="Photo",
+                image=name,
+                image_variants={"original": name},
+            )
+            for _ in range(2)
+        ]
+        MediaBlob.objects.acquire([name])
+        self.assertEqual(self.refs(name), 2)
+
+        posts[0].delete()
+        self.assertEqual(self.refs(name), 1)
+        posts[1].delete()
+        self.assertEqual(self.refs(name), 0)
+
+    def test_orphans_are_collected_after_the_grace_period(self):
+        orphan, kept = self.save(), self.save(b"kept")
+        MediaBlob.objects.release([orphan])
+
+        self.assertIn("Deleted 0 files", self.gc())
+        self.assertIn("Would delete 1 files", self.gc("--grace-seconds=0", "--dry-run"))
+        self.assertTrue(default_storage.exists(orphan))
+
+        self.assertIn("Deleted 1 files", self.gc("--grace-seconds=0"))
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertIsNone(self.refs(orphan))
+        self.assertTrue(default_storage.exists(kept))
+
+    def test_uploads_racing_the_collector_keep_their_file(self):
+        name = self.save()
+        MediaBlob.objects.release([name])
+        blob = MediaBlob.objects.get(name=name)
+
+        # The same contents are uploaded after gc_media listed the orphan
+        self.assertEqual(self.save(), name)
+        self.assertIsNone(GCMediaCommand().collect(blob))
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+
+        # Or once it was collected, the file is stored again
+        MediaBlob.objects.release([name])
+        self.assertIsNotNone(GCMediaCommand().collect(blob))
+        self.assertEqual(self.save(), name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+
+    def test_reconcile(self):
+        name = self.save()
+        Post.objects.create(
+            user=self.author,
+            text_content="Photo",
+            image=name,
+            image_variants={"original": name},
+        )
+        MediaBlob.objects.filter(name=name).update(refs=5)
+        untracked = os.path.join(self.media_root, "uploads", "post", "old.png")
+        with open(untracked, "wb") as file:
+            file.write(b"left over")
+        os.utime(untracked, (0, 0))
+
+        output = self.gc("--reconcile", "--grace-seconds=0")
+
+        self.assertIn("1 changed", output)
+        self.assertEqual(self.refs(name), 1)
+        self.assertFalse(os.path.exists(untracked))
+        self.assertTrue(default_storage.exists(name))
+
+
+class BulkPostTests(TestCase):
+    url = "/api/my-posts/bulk/"
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user("author")
+        self.other = create_user("other")
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def texts(self, user) -> list:
+        return list(
+            Post.objects.filter(user=user)
+            .order_by("id")
+            .values_list("text_content", flat=True)
+        )
+
+    def test_json_array(self):
+        items = [
+            {"text_content": "First", "hashtags": [{"name": "Cats"}]},
+            {"text_content": "Second", "hashtags": [], "user": "other@example.com"},
+        ]
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["errors"], [])
+        self.assertEqual(self.texts(self.author), ["First", "Second"])
+        self.assertEqual(self.texts(self.other), [])
+        first = Post.objects.get(id=response.data["ids"][0])
+        self.assertEqual([tag.name for tag in first.hashtags.all()], ["cats"])
+
+    def test_json_lines(self):
+        body = "\n".join(
+            json.dumps({"text_content": text, "hashtags": []})
+            for text in ["First", "", "Third"]
+        )
+        response = self.client.post(
+            self.url, body + "\n\n", content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertEqual(response.data["errors"][0]["index"], 1)
+        self.assertEqual(self.texts(self.author), ["First", "Third"])
+
+        response = self.client.post(
+            self.url, "{}\nnot json\n", content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("line 2", response.data["detail"])
+
+    def test_errors_are_reported_per_index(self):
+        items = [
+            "text",
+            {"text_content": "Valid", "hashtags": []},
+            {"hashtags": []},
+            {"text_content": "Bad tag", "hashtags": [{"name": "#"}]},
+        ]
+        response = self.client.post(self.url, items, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [
+                (error["index"], list(error["errors"]))
+                for error in response.data["errors"]
+            ],
+            [(0, ["non_field_errors"]), (2, ["text_content"]), (3, ["hashtags"])],
+        )
+        self.assertEqual(self.texts(self.author), ["Valid"])
+
+        response = self.client.post(self.url, items[2:], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["created"], 0)
+
+    @override_settings(BULK_POSTS_MAX_ITEMS=2)
+    def test_item_limit(self):
+        items = [{"text_content": "Post", "hashtags": []}] * 3
+        response = self.client.post(self.url, items, format="json")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(self.url, {"text_content": "Post"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+    def import_posts(self, lines: list, *args) -> tuple[str, str]:
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as file:
+            file.write("\n".join(lines))
+        self.addCleanup(os.remove, file.name)
+
+        out, err = StringIO(), StringIO()
+        call_command("import_posts", file.name, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_posts(self):
+        items = [
+            {"text_content": "By author", "hashtags": [], "user": "author@example.com"},
+            {"text_content": "By other", "hashtags": [], "user": "other@example.com"},
+            {"text_content": "Unknown", "hashtags": [], "user": "nobody@example.com"},
+        ]
+        out, err = self.import_posts(
+            [json.dumps(item) for item in items], "--batch-size=2"
+        )
+
+        self.assertIn("Created 2 posts, 1 failed", out)
+        self.assertIn("Item 2:", err)
+        self.assertEqual(self.texts(self.author), ["By author"])
+        self.assertEqual(self.texts(self.other), ["By other"])
+
+        out, _ = self.import_posts([json.dumps(items)], "--user=author@example.com")
+        self.assertIn("Created 3 posts, 0 failed", out)
+        self.assertEqual(
+            self.texts(self.author), ["By author", "By author", "By other", "Unknown"]
+        )
+
+        with self.assertRaisesMessage(CommandError, "No user with email"):
+            self.import_posts([], "--user=nobody@example.com")
+
+
+def jpeg_with_exif(size=(1600, 800)) -> bytes:
+    exif = Image.Exif()
+    exif[0x010F] = "Camera maker"
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, format="JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+class ImageProcessingTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.author = create_user("author")
+        self.post = Post.objects.create(user=self.author, text_content="Photo")
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def refs(self, names) -> list:
+        blobs = dict(MediaBlob.objects.values_list("name", "refs"))
+        return [blobs.get(name) for name in names]
+
+    def assertProcessed(self, name: str, variants: dict):
+        self.assertEqual(name, variants[ORIGINAL])
+        self.assertTrue(name.endswith(".jpg"))
+        with default_storage.open(name) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (1600, 800))
+            self.assertEqual(len(image.getexif()), 0)
+        for variant, size in [("thumbnail", 320), ("medium", 1080)]:
+            with default_storage.open(variants[variant]) as file:
+                with Image.open(file) as image:
+                    self.assertEqual(image.format, "WEBP")
+                    self.assertEqual(image.size, (size, size // 2))
+        self.assertEqual(self.refs(variants.values()), [1, 1, 1])
+
+    def test_post_upload_is_processed_after_commit(self):
+        upload = SimpleUploadedFile("photo.JPG", jpeg_with_exif(), "image/jpeg")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/my-posts/{self.post.id}/upload-image/", {"image": upload}
+            )
+        self.assertEqual(response.status_code, 200)
+        raw = response.data["image"].removeprefix("http://testserver/media/")
+
+        self.post.refresh_from_db()
+        self.assertProcessed(self.post.image.name, self.post.image_variants)
+        self.assertEqual(self.refs([raw]), [0])
+
+        # Processed images aren't processed again
+        with mock.patch("social_media.signals.enqueue") as enqueue:
+            self.post.save()
+        enqueue.assert_not_called()
+
+    def test_profile_picture_is_processed_after_commit(self):
+        raw = default_storage.save(
+            "uploads/profile_pictures/me.jpg", ContentFile(jpeg_with_exif())
+        )
+        profile = self.author.profile
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_picture = raw
+            profile.save()
+
+        profile.refresh_from_db()
+        self.assertProcessed(
+            profile.profile_picture.name, profile.profile_picture_variants
+        )
+        self.assertEqual(self.refs([raw]), [0])
+
+    def test_replaced_images_are_kept(self):
+        raw = default_storage.save("uploads/post/a.jpg", ContentFile(jpeg_with_exif()))
+        newer = default_storage.save("uploads/post/b.png", ContentFile(b"newer"))
+        Post.objects.filter(pk=self.post.pk).update(image=raw)
+        created = []
+
+        def build_variants(file, directory):
+            # The post gets another image while this one is processed
+            Post.objects.filter(pk=self.post.pk).update(image=newer)
+            created.append(images.build_variants(file, directory))
+            return created[0]
+
+        with mock.patch("social_media.tasks.build_variants", build_variants):
+            process_post_image(self.post.pk)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image.name, newer)
+        self.assertEqual(self.post.image_variants, {})
+        self.assertEqual(self.refs(created[0].values()), [0, 0, 0])
+        self.assertEqual(self.refs([raw, newer]), [1, 1])
+
+    def test_missing_rows_and_images_are_skipped(self):
+        process_post_image(self.post.pk)
+        process_post_image(0)
+        process_profile_picture(0)
+        self.assertFalse(MediaBlob.objects.exists())
@@ -0,0 +1,109 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, QuerySet
+
+from user.models import UserProfile
+from .models import Post, TimelineEntry
+
+
+def fan_out_post(post: Post) -> None:
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts) -> None:
+    """Push freshly created posts into the timelines of their authors' followers.
+
+    Authors with more than `TIMELINE_FAN_OUT_LIMIT` followers are switched to
+    fan-out-on-read: their posts are merged into followers' feeds at query time.
+    """
+    posts_by_author = defaultdict(list)
+    for post in posts:
+        posts_by_author[post.user_id].append(post)
+
+    profiles = UserProfile.objects.filter(
+        user_id__in=posts_by_author, fan_out_on_read=False
+    )
+    limit = settings.TIMELINE_FAN_OUT_LIMIT
+
+    for profile in profiles:
+        follower_ids = list(
+            UserProfile.followed_by.through.objects.filter(
+                userprofile_id=profile.id
+            ).values_list("user_id", flat=True)[: limit + 1]
+        )
+
+        if len(follower_ids) > limit:
+            UserProfile.objects.filter(pk=profile.pk).update(fan_out_on_read=True)
+            continue
+
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    owner_id=follower_id, post=post, created_at=post.created_at
+                )
+                for post in posts_by_author[profile.user_id]
+                for follower_id in follower_ids
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+def backfill_timeline(owner_id: int, profile: UserProfile) -> None:
+    """Copy recent posts of a newly followed profile into the follower's timeline"""
+    if profile.fan_out_on_read:
+        return
+
+    recent_posts = Post.objects.filter(user_id=profile.user_id).values_list(
+        "id", "created_at"
+    )[: settings.TIMELINE_BACKFILL_SIZE]
+
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(owner_id=owner_id, post_id=post_id, created_at=created_at)
+            for post_id, created_at in recent_posts
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def remove_from_timeline(owner_id: int, profile: UserProfile) -> None:
+    """Drop posts of an unfollowed profile from the former follower's timeline"""
+    TimelineEntry.objects.filter(
+        owner_id=owner_id, post__user_id=profile.user_id
+    ).delete()
+
+
+def _read_time_authors(user) -> QuerySet:
+    return UserProfile.objects.filter(followed_by=user, fan_out_on_read=True).values(
+        "user_id"
+    )
+
+
+def home_timeline(user) -> QuerySet:
+    """Posts of every followed user, for lookups of single posts.
+
+    The materialized timeline only holds recent posts of each author, lists
+    read it through `timeline_querysets`
+    """
+    followed = UserProfile.objects.filter(followed_by=user).values("user_id")
+    return Post.objects.filter(user_id__in=followed).exclude(user=user)
+
+
+def timeline_querysets(user) -> list[QuerySet]:
+    """The feed of `user` as querysets paginated together by TimelinePagination.
+
+    Materialized posts are read newest first from the user's TimelineEntry
+    rows, a range scan of `timeline_owner_created_idx` joined to Post. Posts of
+    followed fan-out-on-read authors are a second queryset. Both expose the
+    sort key as `timeline_created_at` and `timeline_post_id`.
+    """
+    materialized = Post.objects.filter(timeline_entries__owner=user).annotate(
+        timeline_created_at=F("timeline_entries__created_at"),
+        timeline_post_id=F("timeline_entries__post_id"),
+    )
+    read_time = Post.objects.filter(user_id__in=_read_time_authors(user)).annotate(
+        timeline_created_at=F("created_at"), timeline_post_id=F("id")
+    )
+    return [queryset.exclude(user=user) for queryset in (materialized, read_time)]
@@ -1,12 +1,36 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from social_media.views import AllPostsViewSet, UserPostsViewSet, CommentViewSet
+from social_media.async_views import (
+    AsyncPostDetailView,
+    AsyncPostListView,
+    EventStreamView,
+)
+from social_media.views import (
+    AllPostsViewSet,
+    UserPostsViewSet,
+    CommentViewSet,
+    HashtagViewSet,
+    SearchView,
+    StreamTokenView,
+)
 
 router = DefaultRouter()
 router.register("my-posts", UserPostsViewSet, basename="my-posts")
 router.register("posts", AllPostsViewSet, basename="all-posts")
 router.register("comments", CommentViewSet, basename="comments")
+router.register("hashtags", HashtagViewSet, basename="hashtags")
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("search/", SearchView.as_view(), name="search"),
+    path("stream/", EventStreamView.as_view(), name="stream"),
+    path("stream/token/", StreamTokenView.as_view(), name="stream-token"),
+    path("async/posts/", AsyncPostListView.as_view(), name="async-posts-list"),
+    path(
+        "async/posts/<int:pk>/",
+        AsyncPostDetailView.as_view(),
+        name="async-posts-detail",
+    ),
+] + router.urls
 
 app_name = "social_media"
@@ -1,15 +1,35 @@
-from django.db.models import Count
+import base64
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.contrib.auth import get_user_model
+from django.db.models import F, Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema, OpenApiParameter
-from rest_framework import viewsets, mixins, status
+from drf_spectacular.utils import extend_schema, inline_serializer, OpenApiParameter
+from rest_framework import serializers, viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
+from user.tokens import StreamToken
 from .permissions import IsOwnerOrReadOnly
+from .bulk import BulkPostImporter, JSONLinesParser
+from .cache import AnonymousResponseCacheMixin
+from .events import publish_comment, publish_like, publish_post
 from .filters import PostFilter
+from .pagination import (
+    CommentThreadPagination,
+    KeysetCursorPagination,
+    LikeCursorPagination,
+    TimelinePagination,
+)
 from .serializers import (
     PostSerializer,
     PostHashtagSerializer,
@@ -20,8 +40,13 @@ from .serializers import (
     PostLikeSerializer,
     PostUpdateSerializer,
     PostImageSerializer,
+    TrendingHashtagSerializer,
+    LikeSerializer,
+    SearchResultSerializer,
 )
-from .models import Post, Comment
+from .models import Post, Comment, Like, TrendingHashtag
+from .search import search
+from .timeline import home_timeline, timeline_querysets
 
 
 class CommentViewSet(
@@ -34,6 +59,7 @@ class CommentViewSet(
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = KeysetCursorPagination
 
     def get_serializer_class(self):
         if self.action in ["update", "partial_update"]:
@@ -44,10 +70,68 @@ class CommentViewSet(
         serializer.save(user=self.request.user)
 
     def get_queryset(self):
-        return Comment.objects.filter(user=self.request.user)
+        return Comment.objects.filter(user=self.request.user).select_related("user")
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Post.objects.filter(pk=instance.post_id, comments_amount__gt=0).update(
+                comments_amount=F("comments_amount") - 1
+            )
+
+
+class HashtagViewSet(GenericViewSet):
+    queryset = TrendingHashtag.objects.select_related("hashtag")
+    serializer_class = TrendingHashtagSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    @action(methods=["GET"], detail=False, url_path="trending")
+    def trending(self, request: Request) -> Response:
+        """Endpoint to get hashtags used in the most recent posts"""
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+
+        return Response(serializer.data)
+
+
+def comment_thread_queryset(queryset):
+    return (
+        queryset.select_related("user")
+        .only("id", "post_id", "created_at", "comment_contents", "user__username")
+        .order_by("created_at", "id")
+    )
+
+
+def user_pk_prefetch(lookup: str) -> Prefetch:
+    return Prefetch(lookup, queryset=get_user_model().objects.only("id"))
+
+
+class PostQuerysetMixin:
+    """Prefetch only the relations read by the serializer of the current action"""
+
+    def optimize_queryset(self, queryset):
+        if self.action == "list":
+            return queryset.prefetch_related("hashtags")
+
+        if self.action == "retrieve":
+            first_comments = comment_thread_queryset(Comment.objects.all())[
+                : settings.POST_DETAIL_COMMENTS
+            ]
+            return queryset.prefetch_related(
+                "hashtags",
+                Prefetch(
+                    "post_comments", queryset=first_comments, to_attr="first_comments"
+                ),
+            )
+
+        if self.action == "liked_posts":
+            return queryset.prefetch_related(
+                "hashtags", user_pk_prefetch("likes"), user_pk_prefetch("comments")
+            )
+
+        return queryset
 
 
-class LikeCommentMixin(GenericViewSet):
+class LikeCommentMixin(PostQuerysetMixin, GenericViewSet):
     @action(
         methods=["POST"],
         detail=True,
@@ -59,15 +143,56 @@ class LikeCommentMixin(GenericViewSet):
         post = self.get_object()
         comment_contents = request.data.get("comment_contents")
 
-        comment = Comment.objects.create(
-            user=request.user,
-            post=post,
-            comment_contents=comment_contents,
-        )
+        with transaction.atomic():
+            comment = Comment.objects.create(
+                user=request.user,
+                post=post,
+                comment_contents=comment_contents,
+            )
+            Post.objects.filter(pk=post.pk).update(
+                comments_amount=F("comments_amount") + 1
+            )
+            publish_comment(comment)
 
         serializer = CommentSerializer(comment)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_path="comments",
+        pagination_class=CommentThreadPagination,
+    )
+    def comment_thread(self, request: Request, pk=None) -> Response:
+        """Endpoint to get comments of specified post, oldest first"""
+        post = self.get_object()
+
+        comments = comment_thread_queryset(Comment.objects.filter(post=post))
+        page = self.paginate_queryset(comments)
+        serializer = CommentSerializer(page, many=True)
+
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=["GET"],
+        detail=True,
+        url_path="likes",
+        pagination_class=LikeCursorPagination,
+    )
+    def likers(self, request: Request, pk=None) -> Response:
+        """Endpoint to get users who liked specified post, latest first"""
+        post = self.get_object()
+
+        likes = (
+            Like.objects.filter(post=post)
+            .select_related("user")
+            .only("id", "user__username")
+        )
+        page = self.paginate_queryset(likes)
+        serializer = LikeSerializer(page, many=True)
+
+        return self.get_paginated_response(serializer.data)
+
     @action(
         methods=["POST"],
         detail=True,
@@ -75,18 +200,31 @@ class LikeCommentMixin(GenericViewSet):
         permission_classes=[IsAuthenticated],
     )
     def like(self, request: Request, pk=None) -> Response:
-        """Endpoint for liking a specified post"""
+        """Endpoint for liking (`like: true`) or unliking (`like: false`)
+        a specified post. Toggles the like when `like` is omitted"""
         post = self.get_object()
         user = self.request.user
 
-        if user in post.likes.all():
-            post.likes.remove(user)
-        else:
-            post.likes.add(user)
+        serializer = PostLikeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        like = serializer.validated_data.get("like")
+
+        with transaction.atomic():
+            if like is None:
+                like = not post.is_liked_by(user)
 
-        post.refresh_from_db()
+            if like:
+                if post.add_like(user):
+                    publish_like(post, user)
+            else:
+                post.remove_like(user)
 
-        return Response(status=status.HTTP_200_OK)
+        likes_amount = (
+            Post.objects.filter(pk=post.pk).values_list("likes_amount", flat=True).get()
+        )
+        serializer = PostLikeSerializer({"like": like, "likes_amount": likes_amount})
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         methods=["GET"],
@@ -98,43 +236,36 @@ class LikeCommentMixin(GenericViewSet):
         """Endpoint to get all liked by active user posts"""
         user = self.request.user
 
-        liked_posts = Post.objects.filter(likes=user)
+        liked_posts = self.optimize_queryset(Post.objects.filter(likes=user))
+        page = self.paginate_queryset(liked_posts)
 
-        serializer = PostSerializer(liked_posts, many=True)
+        serializer = PostSerializer(page, many=True)
 
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
 
 class AllPostsViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, LikeCommentMixin
+    AnonymousResponseCacheMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    LikeCommentMixin,
 ):
+    cache_namespace = "posts"
     serializer_class = PostListSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = PostFilter
+    pagination_class = KeysetCursorPagination
     permission_classes = [
         IsAuthenticatedOrReadOnly,
     ]
 
     def get_queryset(self):
         if self.request.user.is_anonymous:
-            queryset = Post.objects.all().prefetch_related("hashtags")
+            queryset = Post.objects.all()
         else:
-            user = self.request.user
-            user_profile = user.profile
-            following_users = user_profile.followed_by.all()
-
-            queryset = (
-                Post.objects.exclude(user=user)
-                .filter(user__in=following_users)
-                .prefetch_related("hashtags")
-            )
+            queryset = home_timeline(self.request.user)
 
-        if self.action == "list":
-            queryset = queryset.annotate(
-                likes_amount=Count("likes"), comments_amount=Count("comments")
-            )
-
-        return queryset
+        return self.optimize_queryset(queryset)
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -149,6 +280,12 @@ class AllPostsViewSet(
         if self.action == "like":
             return PostLikeSerializer
 
+        if self.action == "comment_thread":
+            return CommentSerializer
+
+        if self.action == "likers":
+            return LikeSerializer
+
         return PostSerializer
 
     # Only for documentation purposes
@@ -157,17 +294,33 @@ class AllPostsViewSet(
             OpenApiParameter(
                 "hashtags",
                 type={"type": "str"},
-                description="Filter by hashtags(ex. ?hashtags=hashtag)",
-            )
+                description="Filter by exact hashtag(ex. ?hashtags=hashtag)",
+            ),
+            OpenApiParameter(
+                "hashtag_prefix",
+                type={"type": "str"},
+                description="Filter by hashtag prefix(ex. ?hashtag_prefix=hash)",
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        if request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+
+        paginator = TimelinePagination()
+        querysets = [
+            self.filter_queryset(self.optimize_queryset(queryset))
+            for queryset in timeline_querysets(request.user)
+        ]
+        page = paginator.paginate_querysets(querysets, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
-class UserPostsViewSet(viewsets.ModelViewSet):
+class UserPostsViewSet(PostQuerysetMixin, viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = PostFilter
+    pagination_class = KeysetCursorPagination
     permission_classes = [
         IsAuthenticated,
     ]
@@ -175,19 +328,15 @@ class UserPostsViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
 
-        queryset = (
-            Post.objects.filter(user=user)
-            .prefetch_related("hashtags")
-            .annotate(likes_amount=Count("likes"), comments_amount=Count("comments"))
-        )
+        queryset = Post.objects.filter(user=user)
 
-        return queryset
+        return self.optimize_queryset(queryset)
 
     def get_serializer_class(self):
         if self.action == "list":
             return PostListSerializer
 
-        if self.action == "create":
+        if self.action in ["create", "bulk"]:
             return PostHashtagSerializer
 
         if self.action == "retrieve":
@@ -216,8 +365,39 @@ class UserPostsViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="bulk",
+        parser_classes=[JSONParser, JSONLinesParser],
+    )
+    def bulk(self, request: Request) -> Response:
+        """Endpoint for creating many posts at once from a JSON array
+        or JSON lines (application/x-ndjson). Reports errors per item index"""
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"detail": "Expected a list of posts."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if len(items) > settings.BULK_POSTS_MAX_ITEMS:
+            return Response(
+                {
+                    "detail": f"At most {settings.BULK_POSTS_MAX_ITEMS} posts per request."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        report = BulkPostImporter(user=request.user).run(items)
+
+        if not report["created"] and report["failed"]:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer) -> None:
-        serializer.save(user=self.request.user)
+        post = serializer.save(user=self.request.user)
+        publish_post(post)
 
         # Only for documentation purposes
 
@@ -226,9 +406,85 @@ class UserPostsViewSet(viewsets.ModelViewSet):
             OpenApiParameter(
                 "hashtags",
                 type={"type": "str"},
-                description="Filter by hashtags(ex. ?hashtags=hashtag)",
-            )
+                description="Filter by exact hashtag(ex. ?hashtags=hashtag)",
+            ),
+            OpenApiParameter(
+                "hashtag_prefix",
+                type={"type": "str"},
+                description="Filter by hashtag prefix(ex. ?hashtag_prefix=hash)",
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
+
+
+class SearchView(APIView):
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    page_size = 20
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "q",
+                type={"type": "str"},
+                description="Words to search in posts and comments(ex. ?q=text)",
+            ),
+            OpenApiParameter("cursor", type={"type": "str"}),
+        ],
+        responses=SearchResultSerializer(many=True),
+    )
+    def get(self, request: Request) -> Response:
+        """Endpoint for ranked full-text search over posts and comments"""
+        after = self._decode_cursor(request.query_params.get("cursor"))
+        results = search(
+            request.query_params.get("q", ""), after=after, limit=self.page_size + 1
+        )
+
+        next_link = None
+        if len(results) > self.page_size:
+            results = results[: self.page_size]
+            last = results[-1]
+            next_link = replace_query_param(
+                request.build_absolute_uri(),
+                "cursor",
+                self._encode_cursor(last["score"], last["document_id"]),
+            )
+
+        return Response(
+            {
+                "next": next_link,
+                "results": SearchResultSerializer(results, many=True).data,
+            }
+        )
+
+    @staticmethod
+    def _encode_cursor(score, document_id):
+        return base64.urlsafe_b64encode(
+            json.dumps([score, document_id]).encode()
+        ).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        if cursor is None:
+            return None
+        try:
+            score, document_id = json.loads(base64.urlsafe_b64decode(cursor))
+            return float(score), int(document_id)
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+
+
+class StreamTokenView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        request=None,
+        responses=inline_serializer(
+            "StreamToken", fields={"token": serializers.CharField()}
+        ),
+    )
+    def post(self, request: Request) -> Response:
+        """Endpoint for a short-lived token opening the event stream, pass it
+        as /api/stream/?token=<token>"""
+        return Response({"token": str(StreamToken.for_user(request.user))})
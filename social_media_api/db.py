@@ -0,0 +1,20 @@
+"""Per-connection database tuning for the SQLite profile.
+
+SQLite settings like WAL mode, fsync frequency and the busy timeout are
+connection state, so they are applied with PRAGMAs whenever Django opens a
+connection. With WAL, readers no longer block the writer and the other way
+round; the busy timeout makes concurrent writers wait for the write lock
+instead of failing with "database is locked".
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,152 @@
+"""Serving of user uploaded media in production.
+
+`MEDIA_SERVE_MODE` picks who sends the bytes:
+
+- "django": Python streams the file, honouring single byte ranges.
+- "x-accel-redirect": nginx sends `MEDIA_ACCEL_REDIRECT_PREFIX + path`,
+  mapped to MEDIA_ROOT by an `internal` location.
+- "x-sendfile": Apache mod_xsendfile / lighttpd sends the absolute path.
+
+Content addressed files (`<sha256>.<ext>`) never change, so they get a
+strong ETag from the hash and an immutable year long Cache-Control.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+CONTENT_HASH = re.compile(r"^[0-9a-f]{64}$")
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def resolve(path: str) -> str:
+    if any(part.startswith(".") for part in path.split("/")):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    return full_path
+
+
+def validators(full_path: str, stat) -> tuple[str, str]:
+    """ETag and Cache-Control of a file"""
+    stem, _ = os.path.splitext(os.path.basename(full_path))
+    if CONTENT_HASH.match(stem):
+        return (
+            f'"{stem}"',
+            f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable",
+        )
+    return f'W/"{stat.st_size:x}-{stat.st_mtime_ns:x}"', "public, max-age=3600"
+
+
+def parse_range(header: str, size: int):
+    """`(start, end)` inclusive for a single satisfiable range, None to send
+    the whole file, raises ValueError if the range can't be satisfied"""
+    match = RANGE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last `end` bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def range_applies(request, etag: str, last_modified: int) -> bool:
+    """If-Range sends the range only if the file is unchanged, weak ETags
+    never match"""
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def read_range(full_path: str, start: int, length: int):
+    with open(full_path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def stream(full_path: str, byte_range, size: int):
+    if byte_range is None:
+        return FileResponse(open(full_path, "rb"))
+
+    start, end = byte_range
+    content_type, _ = mimetypes.guess_type(full_path)
+    response = StreamingHttpResponse(
+        read_range(full_path, start, end - start + 1),
+        status=206,
+        content_type=content_type or "application/octet-stream",
+    )
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Length"] = str(end - start + 1)
+    return response
+
+
+def offload(path: str, full_path: str):
+    response = HttpResponse()
+    if settings.MEDIA_SERVE_MODE == "x-accel-redirect":
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+    else:
+        response["X-Sendfile"] = full_path
+    # The web server sets the type and answers range requests itself
+    del response["Content-Type"]
+    return response
+
+
+@require_safe
+def serve_media(request, path: str):
+    """Endpoint for MEDIA_URL files with conditional and range requests"""
+    full_path = resolve(path)
+    stat = os.stat(full_path)
+    etag, cache_control = validators(full_path, stat)
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and settings.MEDIA_SERVE_MODE != "django":
+        response = offload(path, full_path)
+
+    if response is None:
+        byte_range = None
+        range_header = request.headers.get("Range")
+        if range_header and range_applies(request, etag, last_modified):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stat.st_size}"
+                return response
+        response = stream(full_path, byte_range, stat.st_size)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = cache_control
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,332 @@
+"""Always-on request instrumentation exposed in the Prometheus text format.
+
+`MetricsMiddleware` measures every request: duration, database queries and
+their time, serializer and JSON rendering time and body size, labelled by
+URL name and method. Totals go to `Server-Timing` headers, the process-wide registry
+served at `/metrics` (to scrapers sending METRICS_TOKEN) and a warning on the
+`social_media_api.metrics` logger when a view runs more queries than its
+budget (`QUERY_BUDGETS` by URL name and method, else `QUERY_BUDGET`).
+
+Every process keeps its own registry, so with several workers each one is
+scraped separately or the numbers are per worker.
+"""
+import hmac
+import logging
+import threading
+import functools
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    serialization_seconds: float = 0.0
+    rendering_seconds: float = 0.0
+    serializing: bool = False
+
+
+current_stats: ContextVar[RequestStats] = ContextVar("request_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection, counts only inside measured requests.
+    # The context variable follows requests into sync_to_async threads
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def timed_serializer_data(data):
+    """Wraps `BaseSerializer.data`, which every serializer's `data` ends in.
+    Serializers built inside another one count towards the outer one, and
+    queries run while serializing count as database time only"""
+
+    @functools.wraps(data)
+    def wrapper(serializer):
+        stats = current_stats.get()
+        if stats is None or stats.serializing:
+            return data(serializer)
+
+        stats.serializing = True
+        db_seconds = stats.db_seconds
+        started = time.perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            stats.serializing = False
+            stats.serialization_seconds += (
+                time.perf_counter() - started - (stats.db_seconds - db_seconds)
+            )
+
+    return wrapper
+
+
+BaseSerializer.data = property(timed_serializer_data(BaseSerializer.data.fget))
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer adding its time to the rendering time of the request"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            stats = current_stats.get()
+            if stats is not None:
+                stats.rendering_seconds += time.perf_counter() - started
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    def __init__(self, name: str, kind: str, documentation: str, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.buckets = buckets
+        self.samples = {}
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        self.samples[labels] = self.samples.get(labels, 0) + amount
+
+    def observe(self, labels: tuple, value: float) -> None:
+        # Counts per bucket plus one above the last, then sum and count;
+        # made cumulative on exposition
+        counts = self.samples.setdefault(labels, [0] * (len(self.buckets) + 3))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[len(self.buckets)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def exposition(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for labels, value in sorted(self.samples.items()):
+            label_text = ",".join(f'{key}="{escape(label)}"' for key, label in labels)
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{{{label_text}}} {value}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), value):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{self.name}_sum{{{label_text}}} {value[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {value[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Metric(
+            "http_requests_total", "counter", "Requests by view, method and status"
+        )
+        self.duration = Metric(
+            "http_request_duration_seconds",
+            "histogram",
+            "Time until the response is returned",
+            DURATION_BUCKETS,
+        )
+        self.queries = Metric(
+            "http_request_db_queries",
+            "histogram",
+            "Database queries per request",
+            QUERY_BUCKETS,
+        )
+        self.db_seconds = Metric(
+            "http_request_db_seconds_total", "counter", "Time spent in the database"
+        )
+        self.serialization_seconds = Metric(
+            "http_response_serialization_seconds_total",
+            "counter",
+            "Time spent in serializers building response data",
+        )
+        self.rendering_seconds = Metric(
+            "http_response_rendering_seconds_total",
+            "counter",
+            "Time spent rendering response data to JSON",
+        )
+        self.response_bytes = Metric(
+            "http_response_size_bytes_total",
+            "counter",
+            "Size of non-streaming response bodies",
+        )
+        self.over_budget = Metric(
+            "http_request_query_budget_exceeded_total",
+            "counter",
+            "Requests that ran more queries than the budget of their view",
+        )
+
+    def record(self, view, method, status_code, seconds, stats, size) -> None:
+        labels = (("view", view), ("method", method))
+        with self.lock:
+            self.requests.inc(labels + (("status", str(status_code)),))
+            self.duration.observe(labels, seconds)
+            self.queries.observe(labels, stats.queries)
+            self.db_seconds.inc(labels, stats.db_seconds)
+            self.serialization_seconds.inc(labels, stats.serialization_seconds)
+            self.rendering_seconds.inc(labels, stats.rendering_seconds)
+            if size is not None:
+                self.response_bytes.inc(labels, size)
+
+    def record_over_budget(self, view: str, method: str) -> None:
+        with self.lock:
+            self.over_budget.inc((("view", view), ("method", method)))
+
+    def exposition(self) -> str:
+        metrics = (
+            self.requests,
+            self.duration,
+            self.queries,
+            self.db_seconds,
+            self.serialization_seconds,
+            self.rendering_seconds,
+            self.response_bytes,
+            self.over_budget,
+        )
+        with self.lock:
+            lines = [line for metric in metrics for line in metric.exposition()]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def view_name(request) -> str:
+    # URL names keep the label set small, unmatched paths share one label
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match and match.view_name else "unmatched"
+
+
+def query_budget(view: str, method: str) -> int:
+    return settings.QUERY_BUDGETS.get((view, method), settings.QUERY_BUDGET)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+        # Connections opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats: RequestStats, started: float):
+        seconds = time.perf_counter() - started
+        view = view_name(request)
+        size = None if response.streaming else len(response.content)
+
+        registry.record(
+            view, request.method, response.status_code, seconds, stats, size
+        )
+
+        budget = query_budget(view, request.method)
+        if stats.queries > budget:
+            registry.record_over_budget(view, request.method)
+            logger.warning(
+                "%s %s ran %d queries, budget is %d",
+                request.method,
+                view,
+                stats.queries,
+                budget,
+            )
+
+        app_seconds = (
+            seconds
+            - stats.db_seconds
+            - stats.serialization_seconds
+            - stats.rendering_seconds
+        )
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+                f"serialize;dur={stats.serialization_seconds * 1000:.1f}",
+                f"render;dur={stats.rendering_seconds * 1000:.1f}",
+                f"app;dur={max(app_seconds, 0) * 1000:.1f}",
+                f"total;dur={seconds * 1000:.1f}",
+            ]
+        )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, hidden unless the request carries
+    `Authorization: Bearer <METRICS_TOKEN>`"""
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), expected.encode()
+    ):
+        raise Http404
+    return HttpResponse(
+        registry.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
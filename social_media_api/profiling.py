@@ -0,0 +1,306 @@
+"""Opt-in profiling of sampled and slow requests.
+
+With `PROFILING_ENABLED`, every sync request is watched by one background
+thread that samples the stack of the serving thread every
+`PROFILING_INTERVAL` seconds, and its SQL is recorded. The samples are kept
+when the request was picked by `PROFILING_SAMPLE_RATE` or took at least
+`PROFILING_SLOW_SECONDS`, else dropped. Sampling instead of cProfile tracing
+keeps the cost low enough to watch every request, so slow ones are caught.
+
+Captures are JSON files in `PROFILING_DIR`, a ring buffer of the latest
+`PROFILING_MAX_CAPTURES`. Staff browse them at `/admin/profiles/`; stacks
+are also served in the folded format read by flamegraph.pl, inferno and
+speedscope. SQL is stored without parameters. Async requests share the
+event loop thread, so they are not profiled.
+"""
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+
+CAPTURE_ID = re.compile(r"^\d+-[0-9a-f]{8}$")
+
+current_sql: ContextVar[list] = ContextVar("profiled_sql", default=None)
+
+
+def record_sql(execute, sql, params, many, context):
+    log = current_sql.get()
+    if log is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        log.append({"sql": sql, "ms": round((time.perf_counter() - started) * 1000, 3)})
+
+
+def install_sql_recorder(connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """Daemon thread sampling the stacks of threads serving watched requests"""
+
+    def __init__(self, interval: float, root_code):
+        self.interval = interval
+        # Frames above the middleware are the same for every request
+        self.root_code = root_code
+        self.lock = threading.Lock()
+        self.busy = threading.Event()
+        self.watched = {}
+        self.thread = None
+
+    def watch(self, thread_id: int) -> Counter:
+        stacks = Counter()
+        with self.lock:
+            self.watched[thread_id] = stacks
+            self.busy.set()
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="profiling-sampler", daemon=True
+                )
+                self.thread.start()
+        return stacks
+
+    def unwatch(self, thread_id: int) -> None:
+        with self.lock:
+            self.watched.pop(thread_id, None)
+
+    def fold(self, frame) -> str:
+        names = []
+        while frame is not None and frame.f_code is not self.root_code:
+            names.append(frame_name(frame))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def run(self) -> None:
+        while True:
+            self.busy.wait()
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.watched:
+                    # Sleep until the next watched request
+                    self.busy.clear()
+                    continue
+                watched = list(self.watched.items())
+
+            # Folding is slow, requests must not wait on it to (un)watch
+            frames = sys._current_frames()
+            folded = [
+                (thread_id, stacks, self.fold(frames[thread_id]))
+                for thread_id, stacks in watched
+                if thread_id in frames
+            ]
+            del frames
+
+            with self.lock:
+                for thread_id, stacks, stack in folded:
+                    # Counters of finished requests are being read already
+                    if self.watched.get(thread_id) is stacks:
+                        stacks[stack] += 1
+
+
+def capture_path(capture_id: str) -> str:
+    if not CAPTURE_ID.match(capture_id):
+        raise Http404
+    return os.path.join(settings.PROFILING_DIR, f"{capture_id}.json")
+
+
+def save_capture(capture: dict) -> str:
+    """Write a capture and drop the oldest ones over the buffer size"""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    capture_id = f"{time.time_ns()}-{secrets.token_hex(4)}"
+    path = capture_path(capture_id)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(capture, file)
+    os.replace(temporary, path)
+
+    for stale in capture_ids()[settings.PROFILING_MAX_CAPTURES :]:
+        try:
+            os.remove(capture_path(stale))
+        except FileNotFoundError:
+            pass
+    return capture_id
+
+
+def capture_ids() -> list[str]:
+    """Stored captures, newest first"""
+    try:
+        names = os.listdir(settings.PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    ids = [name.removesuffix(".json") for name in names if name.endswith(".json")]
+    return sorted(
+        (capture_id for capture_id in ids if CAPTURE_ID.match(capture_id)),
+        key=lambda capture_id: int(capture_id.split("-")[0]),
+        reverse=True,
+    )
+
+
+def load_capture(capture_id: str) -> dict:
+    try:
+        with open(capture_path(capture_id)) as file:
+            capture = json.load(file)
+    except FileNotFoundError:
+        raise Http404
+    capture["id"] = capture_id
+    return capture
+
+
+def folded(capture: dict) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in capture["stacks"].items())
+
+
+def top_functions(capture: dict, limit: int = 30) -> list[dict]:
+    """Functions by samples on the stack (total) and at its top (self)"""
+    total, own = Counter(), Counter()
+    for stack, count in capture["stacks"].items():
+        names = stack.split(";")
+        own[names[-1]] += count
+        for name in set(names):
+            total[name] += count
+
+    samples = sum(capture["stacks"].values()) or 1
+    return [
+        {
+            "name": name,
+            "total": count,
+            "self": own[name],
+            "percent": round(count * 100 / samples, 1),
+        }
+        for name, count in total.most_common(limit)
+    ]
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+        self.sampler = StackSampler(
+            settings.PROFILING_INTERVAL, ProfilingMiddleware.profile.__code__
+        )
+        connection_created.connect(install_sql_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_sql_recorder(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        return self.profile(request)
+
+    def profile(self, request):
+        sql = []
+        token = current_sql.set(sql)
+        stacks = self.sampler.watch(threading.get_ident())
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            seconds = time.perf_counter() - started
+            self.sampler.unwatch(threading.get_ident())
+            current_sql.reset(token)
+
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            reason = "sampled"
+        elif seconds >= settings.PROFILING_SLOW_SECONDS:
+            reason = "slow"
+        else:
+            return response
+
+        match = getattr(request, "resolver_match", None)
+        save_capture(
+            {
+                "reason": reason,
+                "captured_at": timezone.now().isoformat(timespec="seconds"),
+                "method": request.method,
+                "path": request.path,
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                "duration_ms": round(seconds * 1000, 1),
+                "interval_ms": settings.PROFILING_INTERVAL * 1000,
+                "stacks": dict(stacks),
+                "sql": sql,
+            }
+        )
+        return response
+
+
+@staff_member_required
+def capture_list(request):
+    captures = []
+    for capture_id in capture_ids():
+        try:
+            capture = load_capture(capture_id)
+        except Http404:
+            # Pruned since the directory was listed
+            continue
+        capture["queries"] = len(capture.pop("sql"))
+        capture["samples"] = sum(capture.pop("stacks").values())
+        captures.append(capture)
+
+    return render(
+        request,
+        "admin/profiling/capture_list.html",
+        {**admin.site.each_context(request), "title": "Profiles", "captures": captures},
+    )
+
+
+@staff_member_required
+def capture_detail(request, capture_id):
+    capture = load_capture(capture_id)
+    return render(
+        request,
+        "admin/profiling/capture_detail.html",
+        {
+            **admin.site.each_context(request),
+            "title": f"{capture['method']} {capture['path']}",
+            "capture": capture,
+            "functions": top_functions(capture),
+            "db_ms": round(sum(query["ms"] for query in capture["sql"]), 1),
+        },
+    )
+
+
+@staff_member_required
+def capture_folded(request, capture_id):
+    """Stacks in the folded format, one `frame;frame;frame samples` per line"""
+    response = HttpResponse(
+        folded(load_capture(capture_id)), content_type="text/plain; charset=utf-8"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{capture_id}.folded"'
+    return response
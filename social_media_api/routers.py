@@ -0,0 +1,159 @@
+"""Primary / replica database routing.
+
+Writes always go to the "default" primary. Reads of GET, HEAD and OPTIONS
+requests to API views go to one of `DATABASE_REPLICAS`, picked per request
+so all its queries see the same snapshot. Other requests, management
+commands and background tasks read from the primary, and so does the rest
+of a request once it wrote.
+
+Replicas lag behind the primary, so after a successful write by a user all
+their requests read from the primary for `REPLICA_STICKY_SECONDS` and they
+see their own changes right away. The user is taken from the JWT of the
+request and the pin is kept in the default cache, which settings require
+to be shared (REDIS_URL) as soon as replicas are configured.
+"""
+import random
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from social_media.async_views import AsyncReadView
+
+
+@dataclass
+class RoutingState:
+    # Replica alias reads of the current request go to, None for the primary
+    replica: str = None
+
+
+# Holds a mutable state, process_view may run in a copy of the context
+current_routing: ContextVar[RoutingState] = ContextVar("db_routing", default=None)
+
+
+def _pin_key(user_id) -> str:
+    return f"db-routing:primary:{user_id}"
+
+
+def request_user_id(request):
+    """Id of the user the request is authenticated as by its JWT, if any"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    return token.get(api_settings.USER_ID_CLAIM)
+
+
+def pin_to_primary(user_id) -> None:
+    """Read from the primary for the user's next requests"""
+    cache.set(_pin_key(user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def pinned_to_primary(user_id) -> bool:
+    return cache.get(_pin_key(user_id), False)
+
+
+def reads_replica(view_func) -> bool:
+    view_class = getattr(view_func, "cls", None) or getattr(
+        view_func, "view_class", None
+    )
+    return isinstance(view_class, type) and issubclass(
+        view_class, (APIView, AsyncReadView)
+    )
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        if state is None or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            # Reads after a write must see it
+            state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas copy the schema of the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = current_routing.set(RoutingState())
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        self.pin_after_write(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = current_routing.set(RoutingState())
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        self.pin_after_write(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = current_routing.get()
+        if (
+            state is None
+            or not settings.DATABASE_REPLICAS
+            or request.method not in SAFE_METHODS
+            or not reads_replica(view_func)
+        ):
+            return None
+
+        user_id = request_user_id(request)
+        if user_id is None or not pinned_to_primary(user_id):
+            state.replica = random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def pin_after_write(self, request, response) -> None:
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            user_id = request_user_id(request)
+            if user_id is not None:
+                pin_to_primary(user_id)
@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -44,15 +47,16 @@ INSTALLED_APPS = [
     "rest_framework",
     "rest_framework_simplejwt.token_blacklist",
     "django_filters",
-    "debug_toolbar",
     "drf_spectacular",
     "user",
     "social_media",
 ]
 
 MIDDLEWARE = [
+    "social_media_api.metrics.MetricsMiddleware",
+    "social_media_api.profiling.ProfilingMiddleware",
+    "social_media_api.routers.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -85,13 +89,119 @@ WSGI_APPLICATION = "social_media_api.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DATABASE_PROFILE picks the database:
+# - "sqlite" (default): the local file, tuned by SQLITE_PRAGMAS on connect
+# - "postgres": POSTGRES_* settings through psycopg. Django 5.0 has no
+#   connection pool, persistent per-thread connections stand in for one
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "sqlite")
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", 600))
+
+if DATABASE_PROFILE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "social_media_api"),
+            "USER": os.getenv("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "127.0.0.1"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+        }
+    }
+elif DATABASE_PROFILE == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DATABASE_PROFILE {DATABASE_PROFILE!r}")
+
+# Read replicas of the primary, comma separated: POSTGRES_REPLICA_HOSTS for
+# "postgres", SQLITE_REPLICA_PATHS for "sqlite" (copies kept in sync by the
+# operator). Safe-method API requests read from them, see
+# social_media_api.routers. Tests read replicas from the test primary
+if DATABASE_PROFILE == "postgres":
+    replica_key, replicas = "HOST", os.getenv("POSTGRES_REPLICA_HOSTS", "")
+else:
+    replica_key, replicas = "NAME", os.getenv("SQLITE_REPLICA_PATHS", "")
+for index, replica in enumerate(filter(None, map(str.strip, replicas.split(","))), 1):
+    DATABASES[f"replica{index}"] = {
+        **DATABASES["default"],
+        replica_key: replica,
+        "TEST": {"MIRROR": "default"},
     }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["social_media_api.routers.PrimaryReplicaRouter"]
+# Reads of a user stay on the primary this long after their write
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+
+# Applied to every new SQLite connection, see social_media_api.db
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -20_000,
+    "temp_store": "MEMORY",
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Set REDIS_URL (e.g. redis://127.0.0.1:6379/0) to use any Redis-protocol
+# server instead of the per-process local-memory cache. Only a shared cache
+# lets JWT claims and issued refresh tokens be trusted without a query
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "social-media-api",
+    },
+    # Login rate limit counters, kept local to each process
+    "throttle": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "throttle",
+    },
 }
 
+if os.getenv("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+    }
+
+if DATABASE_REPLICAS and CACHES["default"]["BACKEND"].endswith("LocMemCache"):
+    # Read-your-writes pins must reach every process serving the user
+    raise ImproperlyConfigured("Read replicas need a shared cache, set REDIS_URL")
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 30))
+RESPONSE_CACHE_LOCK_TIMEOUT = 5
+RESPONSE_CACHE_POLL_INTERVAL = 0.05
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+
+PASSWORD_HASHERS = [
+    "user.hashers.TunablePBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+# Existing hashes are upgraded to the new count on the next login
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", 720_000))
+
+# At most this many password checks run at once per process, logins waiting
+# longer than the timeout (seconds) get a 503
+LOGIN_HASHING_CONCURRENCY = int(os.getenv("LOGIN_HASHING_CONCURRENCY", 2))
+LOGIN_HASHING_TIMEOUT = 2
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -132,6 +242,12 @@ STATIC_URL = "static/"
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
+# Uploads are stored once per content hash, see social_media.storage
+STORAGES = {
+    "default": {"BACKEND": "social_media.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -139,13 +255,20 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "user.User"
 
-INTERNAL_IPS = ("127.0.0.1",)
+# Bearer token scrapers send to /metrics, which is hidden while it's unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+    "DEFAULT_AUTHENTICATION_CLASSES": ("user.authentication.ClaimsJWTAuthentication",),
+    "DEFAULT_RENDERER_CLASSES": (
+        "social_media_api.metrics.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
     ),
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": os.getenv("LOGIN_IP_RATE", "30/min"),
+        "login_account": os.getenv("LOGIN_ACCOUNT_RATE", "10/min"),
+    },
 }
 
 SIMPLE_JWT = {
@@ -156,3 +279,81 @@ SIMPLE_JWT = {
 }
 
 AUTHENTICATION_BACKENDS = ["user.auth_backends.EmailBackend"]
+
+# Home timeline: authors with more followers than the limit are served
+# with fan-out-on-read instead of being copied into every follower's timeline
+TIMELINE_FAN_OUT_LIMIT = int(os.getenv("TIMELINE_FAN_OUT_LIMIT", 10_000))
+TIMELINE_BACKFILL_SIZE = int(os.getenv("TIMELINE_BACKFILL_SIZE", 100))
+
+# Trending hashtags are precomputed by `manage.py refresh_trending_hashtags`,
+# run it periodically (e.g. from cron)
+TRENDING_HASHTAGS_WINDOW_HOURS = 24
+TRENDING_HASHTAGS_LIMIT = 50
+
+# Bulk post ingestion (POST /api/my-posts/bulk/ and `manage.py import_posts`)
+BULK_POSTS_BATCH_SIZE = 500
+BULK_POSTS_MAX_ITEMS = 1000
+
+# Amount of comments embedded into post detail, the rest is paginated
+# by GET /api/posts/{id}/comments/
+POST_DETAIL_COMMENTS = 10
+
+# User search typeahead: max results per request and how many index rows
+# are read for ranking
+USER_TYPEAHEAD_LIMIT = 10
+USER_TYPEAHEAD_CANDIDATES = 200
+
+# Background tasks (image processing): "thread" runs them on a local worker
+# pool, "sync" inline within the request
+TASKS_BACKEND = os.getenv("TASKS_BACKEND", "thread")
+TASKS_WORKERS = int(os.getenv("TASKS_WORKERS", 4))
+
+# Uploaded images are re-encoded without metadata and resized into WebP
+# variants, by name: max side in pixels
+IMAGE_VARIANTS = {"thumbnail": 320, "medium": 1080}
+IMAGE_WEBP_QUALITY = 80
+
+# `manage.py gc_media` only deletes files unreferenced for at least this long
+MEDIA_GC_GRACE_SECONDS = 3600
+
+# Media serving, see social_media_api.media: "django", "x-accel-redirect"
+# (nginx, with an internal location for the prefix) or "x-sendfile"
+MEDIA_SERVE_MODE = os.getenv("MEDIA_SERVE_MODE", "django")
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Live events (GET /api/stream/, ASGI only): "memory" delivers within one
+# server process, "redis" across processes through EVENTS_REDIS_URL
+EVENTS_BROKER = os.getenv("EVENTS_BROKER", "memory")
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL", os.getenv("REDIS_URL"))
+EVENTS_QUEUE_SIZE = 100
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_RETRY_MILLISECONDS = 5000
+# EventSource can't send headers, it opens the stream with a token from
+# POST /api/stream/token/ in the query string. Reconnects need a fresh one
+EVENTS_TOKEN_LIFETIME = timedelta(minutes=1)
+
+# Requests running more database queries than their view's budget (by URL
+# name and method, QUERY_BUDGET for the rest) are logged and counted in /metrics
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", 20))
+QUERY_BUDGETS = {
+    ("social_media:all-posts-detail", "GET"): 5,
+    ("social_media:async-posts-detail", "GET"): 5,
+    ("social_media:my-posts-detail", "GET"): 5,
+}
+
+# Opt-in profiling, see social_media_api.profiling: stacks and SQL of a
+# fraction of requests and of requests slower than the threshold (seconds),
+# the latest PROFILING_MAX_CAPTURES are kept and shown at /admin/profiles/
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0.0))
+PROFILING_SLOW_SECONDS = float(os.getenv("PROFILING_SLOW_SECONDS", 1.0))
+PROFILING_INTERVAL = 0.005
+# Outside the source tree, captures hold request paths and SQL
+PROFILING_DIR = os.getenv(
+    "PROFILING_DIR", os.path.join(tempfile.gettempdir(), "social_media_api-profiles")
+)
+PROFILING_MAX_CAPTURES = 100
+
+# Builds the test database without migration files
+TEST_RUNNER = "social_media_api.testing.TestRunner"
@@ -0,0 +1,55 @@
+"""Minimal background task queue with local backends.
+
+`TASKS_BACKEND = "thread"` runs tasks on a process-wide thread pool of
+`TASKS_WORKERS` threads, `"sync"` runs them inline (handy in tests and
+management commands). Tasks are submitted only once the surrounding
+transaction commits, so they always see the rows that scheduled them.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.TASKS_WORKERS, thread_name_prefix="tasks"
+            )
+        return _executor
+
+
+def run_task(func, args, kwargs) -> None:
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Task %s failed", func.__qualname__)
+
+
+def run_in_thread(func, args, kwargs) -> None:
+    try:
+        run_task(func, args, kwargs)
+    finally:
+        # Worker threads own their connections, don't leave them open
+        connections.close_all()
+
+
+def submit(func, *args, **kwargs) -> None:
+    if settings.TASKS_BACKEND == "sync":
+        run_task(func, args, kwargs)
+    else:
+        get_executor().submit(run_in_thread, func, args, kwargs)
+
+
+def enqueue(func, *args, **kwargs) -> None:
+    """Run `func(*args, **kwargs)` in the background after commit"""
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
@@ -0,0 +1,68 @@
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Creates the tables of the project apps from their models and hashes
+    passwords with a fast hasher.
+
+    The apps ship without migration files, which the auth and admin
+    migrations depending on the custom user model can not run without.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Real hashing rounds would dominate the run time
+        self.fast_hashing = override_settings(
+            PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]
+        )
+        self.fast_hashing.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.fast_hashing.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        with override_settings(MIGRATION_MODULES={"user": None, "social_media": None}):
+            return super().setup_databases(**kwargs)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin guarding endpoints against N+1 query regressions"""
+
+    def assertQueryBudget(self, budget: int, func, *args, **kwargs):
+        """Call `func` and fail if it runs more than `budget` queries"""
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+
+        queries = "\n".join(query["sql"] for query in context.captured_queries)
+        self.assertLessEqual(
+            len(context),
+            budget,
+            f"{len(context)} queries executed, budget is {budget}:\n{queries}",
+        )
+        return result
+
+    def assertConstantQueries(self, request, add_rows, budget: int = None):
+        """Fail if `request` runs more queries after `add_rows` grew the data.
+
+        `request` is called once before and once after `add_rows`; with a
+        `budget` both runs must also stay within it.
+        """
+        with CaptureQueriesContext(connection) as before:
+            request()
+
+        add_rows()
+
+        with CaptureQueriesContext(connection) as after:
+            request()
+
+        self.assertEqual(
+            len(before),
+            len(after),
+            "Query count depends on the amount of rows: "
+            f"{len(before)} before, {len(after)} after adding rows",
+        )
+        if budget is not None:
+            self.assertLessEqual(len(after), budget)
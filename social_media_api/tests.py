@@ -0,0 +1,359 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve
+from rest_framework.serializers import Serializer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from social_media.models import Post
+from social_media_api import profiling
+from social_media_api.routers import ReplicaRoutingMiddleware
+from user.models import User, UserProfile
+
+
+def create_user(name: str) -> User:
+    user = User.objects.create_user(
+        email=f"{name}@example.com", password="password", username=name
+    )
+    UserProfile.objects.create(user=user, bio=f"Bio of {name}")
+    return user
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("author")
+        self.post = Post.objects.create(user=self.user, text_content="Post")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/my-posts/{self.post.id}/"
+
+    def test_metrics_need_the_token(self):
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+        with override_settings(METRICS_TOKEN="secret"):
+            for header in ["", "Bearer wrong"]:
+                with self.subTest(header=header):
+                    response = self.client.get("/metrics", HTTP_AUTHORIZATION=header)
+                    self.assertEqual(response.status_code, 404)
+
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"http_response_rendering_seconds_total", response.content)
+
+    def timings(self, response) -> dict:
+        timings = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, duration = entry.split(";")[:2]
+            timings[name] = float(duration.removeprefix("dur="))
+        return timings
+
+    def test_serialization_is_timed_separately(self):
+        to_representation = Serializer.to_representation
+
+        def slow_to_representation(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(Serializer, "to_representation", slow_to_representation):
+            response = self.client.get(self.url)
+
+        timings = self.timings(response)
+        self.assertGreaterEqual(timings["serialize"], 50)
+        self.assertLess(timings["app"], 50)
+        self.assertLessEqual(
+            timings["db"] + timings["serialize"] + timings["render"] + timings["app"],
+            timings["total"] + 0.5,
+        )
+
+        with override_settings(METRICS_TOKEN="secret"):
+            exposition = self.client.get(
+                "/metrics", HTTP_AUTHORIZATION="Bearer secret"
+            ).content.decode()
+        self.assertIn(
+            "http_response_serialization_seconds_total"
+            '{view="social_media:my-posts-detail",method="GET"}',
+            exposition,
+        )
+
+    @override_settings(
+        QUERY_BUDGETS={("social_media:my-posts-detail", "GET"): 0}, QUERY_BUDGET=100
+    )
+    def test_budgets_are_per_method(self):
+        with self.assertLogs("social_media_api.metrics", "WARNING"):
+            self.client.get(self.url)
+
+        with self.assertNoLogs("social_media_api.metrics", "WARNING"):
+            self.client.patch(self.url, {"text_content": "Edit"}, format="json")
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("author")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def read_alias(
+        self, method="get", path="/api/posts/", status=200, write=False, **headers
+    ):
+        """Database the request's reads are routed to once its view is known"""
+        aliases = []
+
+        def view(request):
+            middleware.process_view(request, resolve(path).func, (), {})
+            if write:
+                router.db_for_write(Post)
+            aliases.append(router.db_for_read(Post))
+            return HttpResponse(status=status)
+
+        middleware = ReplicaRoutingMiddleware(view)
+        middleware(getattr(RequestFactory(), method)(path, **headers))
+        return aliases[0]
+
+    def test_safe_api_requests_read_replicas(self):
+        for headers in [{}, self.auth]:
+            for method in ["get", "head", "options"]:
+                with self.subTest(method=method, headers=headers):
+                    self.assertIn(
+                        self.read_alias(method, **headers), ["replica1", "replica2"]
+                    )
+
+    def test_other_requests_read_the_primary(self):
+        self.assertEqual(self.read_alias("post", "/api/my-posts/"), "default")
+        self.assertEqual(self.read_alias(path="/admin/"), "default")
+        self.assertEqual(self.read_alias(write=True), "default")
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.read_alias(), "default")
+
+    def test_writes_pin_their_user_to_the_primary(self):
+        self.read_alias("post", "/api/my-posts/", status=400, **self.auth)
+        self.assertNotEqual(self.read_alias(**self.auth), "default")
+
+        self.read_alias("post", "/api/my-posts/", status=201, **self.auth)
+        self.assertEqual(self.read_alias(**self.auth), "default")
+        self.assertNotEqual(self.read_alias(), "default")
+
+        # The pin expires after REPLICA_STICKY_SECONDS
+        cache.clear()
+        self.assertNotEqual(self.read_alias(**self.auth), "default")
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(router.allow_migrate("replica1", "social_media"))
+        self.assertTrue(router.allow_migrate("default", "social_media"))
+
+
+class MediaServingTests(TestCase):
+    content = bytes(range(256)) * 4
+    name = "a" * 64 + ".png"
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        os.makedirs(os.path.join(self.media_root.name, "uploads"))
+        with open(
+            os.path.join(self.media_root.name, "uploads", self.name), "wb"
+        ) as file:
+            file.write(self.content)
+        with open(os.path.join(self.media_root.name, "secret.txt"), "wb") as file:
+            file.write(b"secret")
+
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root.name, MEDIA_SERVE_MODE="django"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.url = f"/media/uploads/{self.name}"
+
+    def test_full_file_with_validators(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["ETag"], f'"{"a" * 64}"')
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        for header, start, end in [
+            ("bytes=0-9", 0, 9),
+            ("bytes=1000-", 1000, 1023),
+            ("bytes=-24", 1000, 1023),
+            ("bytes=1000-5000", 1000, 1023),
+        ]:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b"".join(response.streaming_content), self.content[start : end + 1]
+                )
+                self.assertEqual(response["Content-Range"], f"bytes {start}-{end}/1024")
+
+    def test_if_range_mismatch_sends_the_whole_file(self):
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"other"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ["bytes=2000-", "bytes=-0", "bytes=20-10"]:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_traversal_hidden_and_missing_paths(self):
+        for path in [
+            "/media/../settings.py",
+            "/media/uploads/../../secret.txt",
+            "/media/.hidden",
+            "/media/uploads/missing.png",
+        ]:
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_only_safe_methods(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_offload(self):
+        with override_settings(MEDIA_SERVE_MODE="x-accel-redirect"):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/protected-media/uploads/{self.name}"
+        )
+        self.assertEqual(response.content, b"")
+        self.assertNotIn("Content-Type", response)
+
+        with override_settings(MEDIA_SERVE_MODE="x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Sendfile"],
+            os.path.join(self.media_root.name, "uploads", self.name),
+        )
+
+
+def spin(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        profiles_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles_dir.cleanup)
+        profiling_settings = override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_SAMPLE_RATE=1.0,
+            PROFILING_DIR=profiles_dir.name,
+            PROFILING_MAX_CAPTURES=2,
+        )
+        profiling_settings.enable()
+        self.addCleanup(profiling_settings.disable)
+        self.user = create_user("author")
+        Post.objects.create(user=self.user, text_content="Post")
+
+    def test_disabled_without_the_setting(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_sampled_requests_are_captured(self):
+        client = APIClient()
+        for path in ["/api/posts/", "/api/posts/?page_size=1", "/user/profiles/"]:
+            self.assertEqual(client.get(path).status_code, 200)
+
+        ids = profiling.capture_ids()
+        self.assertEqual(len(ids), 2)
+        capture = profiling.load_capture(ids[0])
+        self.assertEqual(capture["reason"], "sampled")
+        self.assertEqual(capture["path"], "/user/profiles/")
+        self.assertEqual(capture["view"], "user:all-profiles-list")
+        self.assertTrue(capture["sql"])
+        self.assertNotIn("author", " ".join(query["sql"] for query in capture["sql"]))
+        self.assertEqual(profiling.load_capture(ids[1])["path"], "/api/posts/")
+
+    def test_slow_requests_are_captured(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_SECONDS=60):
+            APIClient().get("/api/posts/")
+        self.assertEqual(profiling.capture_ids(), [])
+
+        with override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_SECONDS=0):
+            APIClient().get("/api/posts/")
+        [capture_id] = profiling.capture_ids()
+        self.assertEqual(profiling.load_capture(capture_id)["reason"], "slow")
+
+    def test_sampler_folds_stacks_below_the_root(self):
+        sampler = profiling.StackSampler(
+            0.001, self.test_sampler_folds_stacks_below_the_root.__code__
+        )
+        stacks = sampler.watch(threading.get_ident())
+        spin(0.1)
+        sampler.unwatch(threading.get_ident())
+
+        self.assertTrue(stacks)
+        for stack in stacks:
+            self.assertTrue(stack.startswith("social_media_api.tests.spin"), stack)
+
+    def test_folded_and_top_functions(self):
+        capture = {"stacks": {"view;query": 3, "view": 1, "other": 1}}
+        self.assertEqual(profiling.folded(capture), "view;query 3\nview 1\nother 1\n")
+        self.assertEqual(
+            profiling.top_functions(capture, limit=2),
+            [
+                {"name": "view", "total": 4, "self": 1, "percent": 80.0},
+                {"name": "query", "total": 3, "self": 3, "percent": 60.0},
+            ],
+        )
+
+    def test_admin_views_need_staff(self):
+        APIClient().get("/api/posts/")
+        [capture_id] = profiling.capture_ids()
+        urls = [
+            "/admin/profiles/",
+            f"/admin/profiles/{capture_id}/",
+            f"/admin/profiles/{capture_id}/folded/",
+        ]
+
+        client = APIClient()
+        client.force_login(self.user)
+        # Browsing captures must not rotate them out
+        no_captures = override_settings(PROFILING_SAMPLE_RATE=0)
+        no_captures.enable()
+        self.addCleanup(no_captures.disable)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 302)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 200)
+
+        response = client.get(urls[2])
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertIn(f"{capture_id}.folded", response["Content-Disposition"])
+
+        for capture_id in ["..%2F..%2Fetc%2Fpasswd", "1-00000000"]:
+            with self.subTest(capture_id=capture_id):
+                response = client.get(f"/admin/profiles/{capture_id}/")
+                self.assertEqual(response.status_code, 404)
@@ -15,18 +15,32 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularSwaggerView,
     SpectacularRedocView,
 )
 
+from social_media_api import profiling
+from social_media_api.media import serve_media
+from social_media_api.metrics import metrics_view
+
 urlpatterns = [
+    path("admin/profiles/", profiling.capture_list, name="profile-list"),
+    path(
+        "admin/profiles/<str:capture_id>/",
+        profiling.capture_detail,
+        name="profile-detail",
+    ),
+    path(
+        "admin/profiles/<str:capture_id>/folded/",
+        profiling.capture_folded,
+        name="profile-folded",
+    ),
     path("admin/", admin.site.urls),
-    path("__debug__/", include("debug_toolbar.urls")),
+    path("metrics", metrics_view, name="metrics"),
     path("api/", include("social_media.urls", namespace="social_media")),
     path("user/", include("user.urls", namespace="user")),
     path("api/doc/", SpectacularAPIView.as_view(), name="schema"),
@@ -38,4 +52,7 @@ urlpatterns = [
     path(
         "api/doc/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"
     ),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(
+        rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", serve_media, name="media"
+    ),
+]
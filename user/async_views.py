@@ -0,0 +1,24 @@
+from social_media.async_views import AsyncPaginatedReadView
+from .filters import UserProfileFilter
+from .models import UserProfile
+from .pagination import UserCursorPagination
+from .serializers import UserProfileListSerializer
+
+
+class AsyncProfileListView(AsyncPaginatedReadView):
+    """Endpoint for the profile list, same as GET /user/profiles/"""
+
+    pagination_class = UserCursorPagination
+
+    async def aget_data(self, request):
+        queryset = UserProfile.objects.select_related("user")
+        if request.user.is_authenticated:
+            queryset = queryset.exclude(user=request.user)
+
+        queryset = UserProfileFilter(request.query_params, queryset=queryset).qs
+        paginator, page = await self.apaginate(queryset, request)
+        serializer = UserProfileListSerializer(
+            page, many=True, context={"request": request}
+        )
+
+        return self.paginated_data(paginator, serializer.data)
@@ -1,19 +1,50 @@
+import threading
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Password hashing is CPU bound, bounding it keeps login bursts from
+# starving every other request of the process
+hashing_slots = threading.BoundedSemaphore(settings.LOGIN_HASHING_CONCURRENCY)
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many logins in progress, try again shortly."
+    default_code = "login_busy"
+
+
+def run_hasher(func, *args):
+    """Call `func` once a hashing slot frees up, 503 if none does in time"""
+    if not hashing_slots.acquire(timeout=settings.LOGIN_HASHING_TIMEOUT):
+        raise LoginBusy()
+    try:
+        return func(*args)
+    finally:
+        hashing_slots.release()
 
 
 class EmailBackend(ModelBackend):
     def authenticate(self, request, **kwargs):
         user_model = get_user_model()
-        try:
-            email = kwargs.get("email", None)
-            if email is None:
-                email = kwargs.get("username", None)
+        email = kwargs.get("email", None)
+        if email is None:
+            email = kwargs.get("username", None)
+        password = kwargs.get("password", None)
 
-            user = user_model.objects.get(email=email, is_active=True)
+        if email is None or password is None:
+            return None
 
-            if user.check_password(kwargs.get("password", None)):
-                return user
-        except user_model.DoesNotExist:
+        user = user_model.objects.filter(email=email, is_active=True).first()
+        if user is None:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            run_hasher(make_password, password)
             return None
+
+        if run_hasher(user.check_password, password):
+            return user
         return None
@@ -0,0 +1,158 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User, UserProfile
+
+USERNAME_CLAIM = "username"
+PROFILE_ID_CLAIM = "profile_id"
+IS_ACTIVE_CLAIM = "is_active"
+AUTH_TIME_CLAIM = "auth_time"
+
+
+def _revoked_key(user_id) -> str:
+    return f"token-claims:revoked:{user_id}"
+
+
+def add_user_claims(token, user) -> None:
+    """Claims ClaimsJWTAuthentication builds `request.user` from. They are
+    copied to every access token refreshed from this login"""
+    profile_id = (
+        UserProfile.objects.filter(user=user).values_list("id", flat=True).first()
+    )
+    token[USERNAME_CLAIM] = user.username
+    token[PROFILE_ID_CLAIM] = profile_id
+    token[IS_ACTIVE_CLAIM] = user.is_active
+    token[AUTH_TIME_CLAIM] = int(time.time())
+
+
+def revoke_user_claims(user_id):
+    """Stop trusting claims of tokens issued to the user so far, they are
+    authenticated against the database until the next login. Returns the
+    revocation time stored on the user"""
+    revoked_at = timezone.now()
+    User.objects.filter(pk=user_id).update(claims_revoked_at=revoked_at)
+    transaction.on_commit(
+        lambda: cache.set(
+            _revoked_key(user_id),
+            revoked_at.timestamp(),
+            timeout=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+        )
+    )
+    return revoked_at
+
+
+def cached_revoked_at(user_id):
+    """Revocation timestamp of the user's claims, 0 if never revoked and
+    None if it has to be loaded"""
+    return cache.get(_revoked_key(user_id))
+
+
+def load_revoked_at(user_id) -> float:
+    """Revocation timestamp stored on the user, cached until it changes"""
+    rows = list(
+        User.objects.filter(pk=user_id).values_list("claims_revoked_at", flat=True)
+    )
+    if not rows:
+        # Deleted users keep no claims
+        return float("inf")
+
+    revoked_at = rows[0].timestamp() if rows[0] else 0
+    # add() loses to a concurrent revocation setting the key
+    cache.add(
+        _revoked_key(user_id),
+        revoked_at,
+        timeout=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+    )
+    return revoked_at
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication without a per-request user lookup.
+
+    `request.user` is a User holding only the id, username and is_active
+    from the token, every other field is deferred and loaded on first access.
+    Its `profile` is primed with the profile id claim. Tokens without these
+    claims, or whose claims were revoked (see `revoke_user_claims`), go
+    through the regular database lookup. So does every token while the
+    default cache is per process, as a revocation would only reach the
+    process that made it.
+    """
+
+    def get_user(self, validated_token):
+        return self.get_claims_user(validated_token) or super().get_user(
+            validated_token
+        )
+
+    def get_claims_user(self, validated_token, load=True):
+        """User built from claims, None if the database must be asked. With
+        `load` false, a revocation time missing from the cache isn't loaded
+        and None is returned"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        auth_time = validated_token.get(AUTH_TIME_CLAIM)
+        if (
+            auth_time is None
+            or not validated_token.get(IS_ACTIVE_CLAIM)
+            or api_settings.CHECK_REVOKE_TOKEN
+            or isinstance(caches["default"], LocMemCache)
+        ):
+            return None
+
+        revoked_at = cached_revoked_at(user_id)
+        if revoked_at is None:
+            if not load:
+                return None
+            revoked_at = load_revoked_at(user_id)
+        if auth_time <= revoked_at:
+            return None
+
+        return self.claims_user(validated_token, user_id)
+
+    @staticmethod
+    def claims_user(validated_token, user_id) -> User:
+        user = User.from_db(
+            router.db_for_read(User),
+            ["id", "username", "is_active"],
+            [user_id, validated_token[USERNAME_CLAIM], True],
+        )
+
+        profile_id = validated_token.get(PROFILE_ID_CLAIM)
+        if profile_id is not None:
+            profile = UserProfile.from_db(
+                router.db_for_read(UserProfile),
+                ["id", "user_id"],
+                [profile_id, user_id],
+            )
+            profile.user = user
+            user._state.fields_cache["profile"] = profile
+
+        return user
+
+
+async def aauthenticate(request):
+    """ClaimsJWTAuthentication for async views, the database is only awaited
+    when the claims can't be trusted from the cache alone. Returns
+    AnonymousUser without a token"""
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return AnonymousUser()
+
+    validated_token = authentication.get_validated_token(raw_token)
+    user = authentication.get_claims_user(validated_token, load=False)
+    if user is None:
+        user = await sync_to_async(authentication.get_user)(validated_token)
+    return user
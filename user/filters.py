@@ -1,12 +1,15 @@
 import django_filters
 from .models import UserProfile
+from .search import matching_user_ids
 
 
 class UserProfileFilter(django_filters.FilterSet):
-    username = django_filters.CharFilter(
-        field_name="user__username", lookup_expr="icontains"
-    )
+    username = django_filters.CharFilter(method="filter_username")
 
     class Meta:
         model = UserProfile
         fields = ["username"]
+
+    def filter_username(self, queryset, name, value):
+        """Prefix match on the username or any of its words"""
+        return queryset.filter(user_id__in=matching_user_ids(value))
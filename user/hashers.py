@@ -0,0 +1,10 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with the work factor taken from PASSWORD_HASH_ITERATIONS"""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
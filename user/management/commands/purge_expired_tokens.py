@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted tokens in batches, run it "
+        "periodically (e.g. from cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        purged = 0
+
+        # Short batches keep locks brief while refreshes keep writing
+        while ids := list(
+            OutstandingToken.objects.filter(expires_at__lte=now).values_list(
+                "id", flat=True
+            )[: options["batch_size"]]
+        ):
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+            purged += len(ids)
+            self.stdout.write(f"Purged {purged} tokens")
+
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired tokens"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from user import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the username search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index(
+            batch_size=options["batch_size"], stdout=self.stdout
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} users"))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from user.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Fix drift between UserProfile followers counters and the real counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        real_followers = Coalesce(
+            Subquery(
+                UserProfile.followed_by.through.objects.filter(
+                    userprofile_id=OuterRef("pk")
+                )
+                .order_by()
+                .values("userprofile_id")
+                .annotate(amount=Count("*"))
+                .values("amount")
+            ),
+            0,
+        )
+
+        last_id = 0
+        fixed = 0
+        while True:
+            batch = list(
+                UserProfile.objects.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            drifted = (
+                UserProfile.objects.filter(pk__in=batch)
+                .annotate(real_followers=real_followers)
+                .exclude(followers_amount=F("real_followers"))
+                .values_list("pk", flat=True)
+            )
+            fixed += UserProfile.objects.filter(pk__in=list(drifted)).update(
+                followers_amount=real_followers
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} profile counters"))
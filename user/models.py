@@ -1,14 +1,15 @@
 import os.path
-import uuid
 
 from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models import QuerySet
+from django.db.models import F, QuerySet
 from django.utils.translation import gettext_lazy as _
 
+from social_media.cache import invalidate
+
 
 class UserManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
@@ -46,6 +47,8 @@ class UserManager(BaseUserManager):
 
 class User(AbstractUser):
     email = models.EmailField(_("email address"), unique=True)
+    # Token claims issued up to this time are no longer trusted
+    claims_revoked_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
@@ -57,9 +60,7 @@ class User(AbstractUser):
 
 
 def profile_picture_filepath(instance, filename):
-    _, extension = os.path.splitext(filename)
-    filename = f"{instance.user.id}-{instance.id}-{uuid.uuid4()}{extension}"
-
+    # The content addressed storage names the file after its hash
     return os.path.join("uploads", "profile_pictures", filename)
 
 
@@ -70,14 +71,55 @@ class UserProfile(models.Model):
     profile_picture = models.ImageField(
         null=True, blank=True, upload_to=profile_picture_filepath
     )
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
     bio = models.TextField()
     followed_by = models.ManyToManyField(User, related_name="following", blank=True)
+    fan_out_on_read = models.BooleanField(default=False)
+    followers_amount = models.PositiveIntegerField(default=0)
 
     @staticmethod
     def validate_unique_profile(user, error_to_raise):
         if UserProfile.objects.filter(user=user).exists():
             raise error_to_raise("A profile already exists for this user.")
 
+    def add_follower(self, user) -> bool:
+        """Insert a follow row unless it exists; return whether it was added"""
+        try:
+            with transaction.atomic():
+                UserProfile.followed_by.through.objects.create(
+                    userprofile_id=self.pk, user_id=user.pk
+                )
+        except IntegrityError:
+            return False
+
+        UserProfile.objects.filter(pk=self.pk).update(
+            followers_amount=F("followers_amount") + 1
+        )
+        # Rows of the auto-created through model send no signals
+        transaction.on_commit(lambda: invalidate("profiles"))
+        return True
+
+    def remove_follower(self, user) -> bool:
+        """Delete a follow row if it exists; return whether it was removed"""
+        deleted, _ = UserProfile.followed_by.through.objects.filter(
+            userprofile_id=self.pk, user_id=user.pk
+        ).delete()
+        if not deleted:
+            return False
+
+        # A counter that drifted to 0 stays there, reconcile_profile_counters
+        # fixes it
+        UserProfile.objects.filter(pk=self.pk, followers_amount__gt=0).update(
+            followers_amount=F("followers_amount") - 1
+        )
+        transaction.on_commit(lambda: invalidate("profiles"))
+        return True
+
+    def is_followed_by(self, user) -> bool:
+        return UserProfile.followed_by.through.objects.filter(
+            userprofile_id=self.pk, user_id=user.pk
+        ).exists()
+
     def clean(self):
         if self.pk is None:
             UserProfile.validate_unique_profile(self.user, ValidationError)
@@ -86,3 +128,22 @@ class UserProfile(models.Model):
         self.full_clean()
 
         super(UserProfile, self).save(*args, **kwargs)
+
+
+class UserSearchTerm(models.Model):
+    """Normalized username prefix keys used by user search"""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="search_terms"
+    )
+    term = models.CharField(max_length=254)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["term", "user"], name="unique_user_search_term"
+            )
+        ]
+
+    def __str__(self):
+        return self.term
@@ -0,0 +1,5 @@
+from social_media.pagination import KeysetCursorPagination
+
+
+class UserCursorPagination(KeysetCursorPagination):
+    ordering = ("-id",)
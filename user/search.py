@@ -0,0 +1,130 @@
+"""Prefix index over normalized usernames.
+
+Every user has a set of casefolded terms in `UserSearchTerm`: the username
+and each word of it. Emails are not indexed, search is open to anonymous
+callers and would tell which addresses are registered. Lookups are `term`
+range scans on the (term, user) unique index. Terms are kept in sync by the User post_save
+signal and can be rebuilt with `manage.py rebuild_user_search_index`.
+"""
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+
+from .models import User, UserProfile, UserSearchTerm
+
+
+def normalize(value: str) -> str:
+    return value.strip().casefold()
+
+
+def user_terms(user) -> set[str]:
+    """Username and every username word (`john_doe` -> `doe`)"""
+    username = normalize(user.username or "")
+    terms = {username}
+    terms.update(re.split(r"[\W_]+", username))
+    return {term for term in terms if term}
+
+
+def index_users(users) -> None:
+    """Replace search terms of `users`"""
+    users = list(users)
+    with transaction.atomic():
+        UserSearchTerm.objects.filter(user__in=users).delete()
+        UserSearchTerm.objects.bulk_create(
+            [
+                UserSearchTerm(user=user, term=term)
+                for user in users
+                for term in user_terms(user)
+            ]
+        )
+
+
+def prefix_matches(query: str) -> QuerySet:
+    # A range instead of LIKE keeps the lookup on the (term, user) index
+    prefix = normalize(query)
+    return UserSearchTerm.objects.filter(
+        term__gte=prefix, term__lt=f"{prefix}\U0010ffff"
+    )
+
+
+def matching_user_ids(query: str) -> QuerySet:
+    return prefix_matches(query).values("user_id")
+
+
+def typeahead(query: str, requester=None, limit: int = None) -> list[dict]:
+    """Top `limit` users matching the prefix, followed accounts first.
+
+    Only a bounded number of candidates is read from the index, so the cost
+    does not depend on how common the prefix is.
+    """
+    prefix = normalize(query)
+    limit = min(limit or settings.USER_TYPEAHEAD_LIMIT, settings.USER_TYPEAHEAD_LIMIT)
+    if not prefix:
+        return []
+
+    matches = prefix_matches(prefix)
+    candidate_ids = set(
+        matches.order_by("term").values_list("user_id", flat=True)[
+            : settings.USER_TYPEAHEAD_CANDIDATES
+        ]
+    )
+
+    followed_ids = set()
+    if requester is not None and requester.is_authenticated:
+        followed_ids = set(
+            matches.filter(user__profile__followed_by=requester).values_list(
+                "user_id", flat=True
+            )[:limit]
+        )
+        candidate_ids.discard(requester.pk)
+
+    users = (
+        User.objects.filter(pk__in=candidate_ids | followed_ids)
+        .select_related("profile")
+        .only("id", "username", "profile__id")
+    )
+
+    def rank(user):
+        username = normalize(user.username)
+        return (
+            user.pk not in followed_ids,
+            username != prefix,
+            not username.startswith(prefix),
+            len(username),
+            username,
+        )
+
+    results = []
+    for user in sorted(users, key=rank)[:limit]:
+        try:
+            profile_id = user.profile.id
+        except UserProfile.DoesNotExist:
+            profile_id = None
+        results.append(
+            {
+                "id": user.id,
+                "username": user.username,
+                "profile": profile_id,
+                "following": user.pk in followed_ids,
+            }
+        )
+    return results
+
+
+def rebuild_index(batch_size=1000, stdout=None) -> int:
+    """Reindex every user in primary key ordered batches"""
+    indexed, last_id = 0, 0
+    while batch := list(
+        User.objects.filter(pk__gt=last_id)
+        .order_by("pk")
+        .only("id", "username")[:batch_size]
+    ):
+        index_users(batch)
+        last_id = batch[-1].pk
+        indexed += len(batch)
+        if stdout:
+            stdout.write(f"Indexed {indexed} users")
+
+    return indexed
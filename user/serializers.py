@@ -3,13 +3,28 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.serializers import (
     TokenObtainPairSerializer as JwtTokenObtainPairSerializer,
+    TokenRefreshSerializer as JwtTokenRefreshSerializer,
 )
 
+from social_media.serializers import ImageVariantsField
+from user.authentication import add_user_claims
 from user.models import UserProfile
+from user.tokens import CachedBlacklistRefreshToken
 
 
 class TokenObtainPairSerializer(JwtTokenObtainPairSerializer):
     username_field = get_user_model().USERNAME_FIELD
+    token_class = CachedBlacklistRefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        add_user_claims(token, user)
+        return token
+
+
+class TokenRefreshSerializer(JwtTokenRefreshSerializer):
+    token_class = CachedBlacklistRefreshToken
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -38,9 +53,18 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
         return data
 
+    profile_picture_variants = ImageVariantsField("profile_picture")
+
     class Meta:
         model = UserProfile
-        fields = ("id", "user", "bio", "profile_picture", "followed_by")
+        fields = (
+            "id",
+            "user",
+            "bio",
+            "profile_picture",
+            "profile_picture_variants",
+            "followed_by",
+        )
         read_only_fields = (
             "user",
             "followed_by",
@@ -49,11 +73,18 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 class UserProfileListSerializer(serializers.ModelSerializer):
     user = serializers.CharField(source="user.username")
-    followers_amount = serializers.IntegerField()
+    profile_picture_variants = ImageVariantsField("profile_picture")
 
     class Meta:
         model = UserProfile
-        fields = ("id", "user", "bio", "profile_picture", "followers_amount")
+        fields = (
+            "id",
+            "user",
+            "bio",
+            "profile_picture",
+            "profile_picture_variants",
+            "followers_amount",
+        )
 
 
 class UserProfileDetailSerializer(UserProfileSerializer):
@@ -64,8 +95,18 @@ class UserProfileDetailSerializer(UserProfileSerializer):
 
 
 class UserProfileFollowSerializer(serializers.ModelSerializer):
-    follow = serializers.BooleanField()
+    """Omitting `follow` toggles the current state"""
+
+    follow = serializers.BooleanField(required=False, allow_null=True)
+    followers_amount = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = UserProfile
-        fields = ("follow",)
+        fields = ("follow", "followers_amount")
+
+
+class UserTypeaheadSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    profile = serializers.IntegerField(allow_null=True)
+    following = serializers.BooleanField()
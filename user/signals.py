@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from social_media.cache import invalidate
+from social_media.images import ORIGINAL, held_media
+from social_media.models import MediaBlob
+from social_media.tasks import process_profile_picture
+from social_media_api.tasks import enqueue
+from .authentication import revoke_user_claims
+from .models import User, UserProfile
+from .search import index_users
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_responses(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate("profiles"))
+
+
+@receiver(post_save, sender=UserProfile)
+def schedule_profile_picture_processing(sender, instance, **kwargs):
+    # Processed pictures are stored under the name of their stripped original
+    picture = instance.profile_picture
+    if picture and picture.name != instance.profile_picture_variants.get(ORIGINAL):
+        enqueue(process_profile_picture, instance.pk)
+
+
+@receiver(post_delete, sender=UserProfile)
+def release_profile_picture(sender, instance, **kwargs):
+    MediaBlob.objects.release(
+        held_media(instance.profile_picture.name, instance.profile_picture_variants)
+    )
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, update_fields=None, **kwargs):
+    # Skip saves like last_login updates that cannot change search terms
+    if update_fields is not None and "username" not in update_fields:
+        return
+    index_users([instance])
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_user_claims(sender, instance, created, update_fields=None, **kwargs):
+    if created or (
+        update_fields is not None
+        and not {"username", "is_active", "password"} & update_fields
+    ):
+        return
+    # A later full save of the instance must not clear the stored time
+    instance.claims_revoked_at = revoke_user_claims(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_claims(sender, instance, **kwargs):
+    revoke_user_claims(instance.pk)
+
+
+@receiver(post_delete, sender=UserProfile)
+def revoke_profile_claims(sender, instance, **kwargs):
+    revoke_user_claims(instance.user_id)
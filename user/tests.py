@@ -1,3 +1,342 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from user import auth_backends
+from user.models import User, UserProfile
+from user.throttling import LoginAccountThrottle, LoginIPThrottle
+
+
+def create_user(name: str, email: str = None) -> User:
+    user = User.objects.create_user(
+        email=email or f"{name}@example.com", password="password", username=name
+    )
+    UserProfile.objects.create(user=user, bio=f"Bio of {name}")
+    return user
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = create_user("alice_smith", email="secret.alice@example.com")
+        self.client = APIClient()
+
+    def usernames(self, url: str) -> list:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if "results" in response.data:
+            return [profile["user"] for profile in response.data["results"]]
+        return [user["username"] for user in response.data]
+
+    def test_username_prefixes_match(self):
+        for query in ["ali", "ALICE_S", "smi"]:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.usernames(f"/user/profiles/?username={query}"),
+                    ["alice_smith"],
+                )
+                self.assertEqual(
+                    self.usernames(f"/user/profiles/typeahead/?q={query}"),
+                    ["alice_smith"],
+                )
+
+    def test_emails_do_not_match(self):
+        for query in ["secret", "secret.alice@", "secret.alice@example.com"]:
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.usernames(f"/user/profiles/?username={query}"), []
+                )
+                self.assertEqual(
+                    self.usernames(f"/user/profiles/typeahead/?q={query}"), []
+                )
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches["throttle"].clear()
+        self.user = create_user("alice")
+        self.client = APIClient()
+        response = self.client.post(
+            "/user/token/", {"email": "alice@example.com", "password": "password"}
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def my_profile_status(self) -> int:
+        return self.client.get("/user/my-profile/").status_code
+
+    def deactivate_without_signals(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+    def test_per_process_cache_uses_the_database(self):
+        self.deactivate_without_signals()
+        self.assertEqual(self.my_profile_status(), 401)
+
+    def my_profile_queries(self) -> int:
+        self.assertEqual(self.my_profile_status(), 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.my_profile_status(), 200)
+        return len(queries)
+
+    def test_shared_cache_skips_the_user_lookup(self):
+        per_process = self.my_profile_queries()
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": tempfile.mkdtemp(),
+                },
+            }
+        ):
+            shared = self.my_profile_queries()
+        self.assertEqual(shared, per_process - 1)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": tempfile.mkdtemp(),
+            },
+        }
+    )
+    def test_revocation_outlives_the_cache(self):
+        self.deactivate_without_signals()
+        # Unrevoked claims are trusted without a user lookup
+        self.assertEqual(self.my_profile_status(), 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.my_profile_status(), 401)
+
+        cache.clear()
+        self.assertEqual(self.my_profile_status(), 401)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.claims_revoked_at)
+
+
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches["throttle"].clear()
+        create_user("alice")
+        self.client = APIClient()
+        response = self.client.post(
+            "/user/token/", {"email": "alice@example.com", "password": "password"}
+        )
+        self.access = response.data["access"]
+        self.refresh = response.data["refresh"]
+
+    def refresh_status(self, refresh: str) -> int:
+        return self.client.post(
+            "/user/token/refresh/", {"refresh": refresh}
+        ).status_code
+
+    def test_rotated_token_stays_rejected_after_eviction(self):
+        self.assertEqual(self.refresh_status(self.refresh), 200)
+        self.assertEqual(self.refresh_status(self.refresh), 401)
+
+        cache.clear()
+        self.assertEqual(self.refresh_status(self.refresh), 401)
+
+    def test_logged_out_token_stays_rejected_after_eviction(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        response = self.client.post("/user/logout/", {"refresh_token": self.refresh})
+        self.assertEqual(response.status_code, 200)
+
+        cache.clear()
+        self.assertEqual(self.refresh_status(self.refresh), 401)
+
+    def blacklist_lookups(self, refresh: str) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh_status(refresh), 200)
+        return sum(
+            query["sql"].startswith("SELECT") and "blacklistedtoken" in query["sql"]
+            for query in queries.captured_queries
+        )
+
+    def test_per_process_cache_looks_up_fresh_tokens(self):
+        self.assertEqual(self.blacklist_lookups(self.refresh), 1)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": tempfile.mkdtemp(),
+            },
+        }
+    )
+    def test_shared_cache_trusts_issued_tokens(self):
+        refresh = self.client.post(
+            "/user/token/", {"email": "alice@example.com", "password": "password"}
+        ).data["refresh"]
+        rotated = self.client.post("/user/token/refresh/", {"refresh": refresh})
+        self.assertEqual(rotated.status_code, 200)
+        self.assertEqual(self.refresh_status(refresh), 401)
+        self.assertEqual(self.blacklist_lookups(rotated.data["refresh"]), 0)
+
+        cache.clear()
+        self.assertEqual(self.refresh_status(refresh), 401)
+        # Tokens issued before the cache was shared are looked up
+        self.assertEqual(self.blacklist_lookups(self.refresh), 1)
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        caches["throttle"].clear()
+        create_user("alice")
+        self.client = APIClient()
+
+    def login(self, email="alice@example.com", password="password", **kwargs):
+        return self.client.post(
+            "/user/token/",
+            {"email": email, "password": password},
+            format="json",
+            **kwargs,
+        )
+
+    def test_non_object_bodies_are_rejected(self):
+        for body in [[], ["alice@example.com"], "alice", 1]:
+            with self.subTest(body=body):
+                response = self.client.post("/user/token/", body, format="json")
+                self.assertEqual(response.status_code, 400)
+
+    @mock.patch.object(LoginIPThrottle, "rate", "2/min", create=True)
+    def test_attempts_per_address(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login(password="wrong").status_code, 401)
+        self.assertEqual(self.login(email="bob@example.com").status_code, 429)
+
+        response = self.login(REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch.object(LoginAccountThrottle, "rate", "2/min", create=True)
+    def test_attempts_per_account(self):
+        for address in ["10.0.0.1", "10.0.0.2"]:
+            response = self.login(password="wrong", REMOTE_ADDR=address)
+            self.assertEqual(response.status_code, 401)
+
+        # Spelling variants of the email count as the same account
+        response = self.login(email=" ALICE@example.com", REMOTE_ADDR="10.0.0.3")
+        self.assertEqual(response.status_code, 429)
+        response = self.login(email="bob@example.com", REMOTE_ADDR="10.0.0.3")
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(LOGIN_HASHING_TIMEOUT=0)
+    def test_busy_when_no_hashing_slot_frees_up(self):
+        slots = settings.LOGIN_HASHING_CONCURRENCY
+        for _ in range(slots):
+            auth_backends.hashing_slots.acquire()
+        try:
+            response = self.login()
+        finally:
+            for _ in range(slots):
+                auth_backends.hashing_slots.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_unknown_emails_are_hashed_too(self):
+        with mock.patch.object(
+            auth_backends, "make_password", wraps=auth_backends.make_password
+        ) as make_password:
+            self.assertEqual(self.login(email="bob@example.com").status_code, 401)
+
+        make_password.assert_called_once_with("password")
+
+
+class FollowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user("author")
+        self.reader = create_user("reader")
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        self.url = f"/user/profiles/{self.author.profile.id}/follow-user/"
+
+    def follow(self, data=None) -> dict:
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_explicit_state_is_idempotent(self):
+        for _ in range(2):
+            self.assertEqual(
+                self.follow({"follow": True}), {"follow": True, "followers_amount": 1}
+            )
+        for _ in range(2):
+            self.assertEqual(
+                self.follow({"follow": False}),
+                {"follow": False, "followers_amount": 0},
+            )
+
+    def test_toggle(self):
+        self.assertEqual(self.follow(), {"follow": True, "followers_amount": 1})
+        self.assertEqual(self.follow(), {"follow": False, "followers_amount": 0})
+        self.assertFalse(self.author.profile.is_followed_by(self.reader))
+
+    def test_reconcile_profile_counters(self):
+        self.follow({"follow": True})
+        UserProfile.objects.update(followers_amount=5)
+
+        call_command("reconcile_profile_counters", stdout=StringIO())
+
+        self.assertEqual(
+            dict(UserProfile.objects.values_list("user__username", "followers_amount")),
+            {"author": 1, "reader": 0},
+        )
+
+
+class AsyncProfileListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [create_user(name) for name in ["alice", "bob", "carol", "dave"]]
+        self.users[0].profile.add_follower(self.users[1])
+        self.headers = {
+            "Authorization": f"Bearer {AccessToken.for_user(self.users[1])}"
+        }
+
+    def get(self, query: str, headers=None) -> tuple:
+        """Payloads of GET /user/profiles/ and /user/async/profiles/ with
+        links reduced to their cursor"""
+        sync = APIClient(headers=headers).get(f"/user/profiles/{query}")
+        # AsyncClient ignores client-wide headers
+        asynchronous = async_to_sync(AsyncClient().get)(
+            f"/user/async/profiles/{query}", headers=headers
+        )
+        self.assertEqual(sync.status_code, asynchronous.status_code)
+
+        payloads = []
+        for data in [sync.json(), asynchronous.json()]:
+            for key in ["next", "previous"]:
+                if data.get(key):
+                    data[key] = data[key].split("?", 1)[1]
+            payloads.append(data)
+        return payloads
+
+    def test_payloads_match_the_sync_endpoint(self):
+        for headers in [None, self.headers]:
+            for query in ["", "?page_size=2", "?username=car"]:
+                with self.subTest(query=query, headers=headers):
+                    sync, asynchronous = self.get(query, headers)
+                    self.assertEqual(asynchronous, sync)
+
+        sync, _ = self.get("?page_size=2")
+        sync, asynchronous = self.get(f"?{sync['next']}")
+        self.assertEqual(asynchronous, sync)
+        self.assertEqual(len(sync["results"]), 2)
+
+    def test_invalid_token(self):
+        sync, asynchronous = self.get("", {"Authorization": "Bearer garbage"})
+        self.assertEqual(asynchronous, sync)
+        self.assertEqual(asynchronous["code"], "token_not_valid")
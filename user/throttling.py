@@ -0,0 +1,38 @@
+from collections.abc import Mapping
+
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LoginThrottle(SimpleRateThrottle):
+    cache = caches["throttle"]
+
+
+class LoginIPThrottle(LoginThrottle):
+    scope = "login_ip"
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": self.get_ident(request),
+        }
+
+
+class LoginAccountThrottle(LoginThrottle):
+    """Limits attempts per email, whichever address they come from"""
+
+    scope = "login_account"
+
+    def get_cache_key(self, request, view):
+        # Bodies that aren't objects are rejected by the serializer
+        if not isinstance(request.data, Mapping):
+            return None
+
+        email = request.data.get("email")
+        if not isinstance(email, str) or not email:
+            return None
+
+        return self.cache_format % {
+            "scope": self.scope,
+            "ident": email.strip().casefold(),
+        }
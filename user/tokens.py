@@ -0,0 +1,88 @@
+"""Refresh tokens with a cache in front of the token blacklist.
+
+Blacklisted jtis are cached until their token expires, so replays of a
+rotated or logged out refresh token are rejected without a query. Issued
+jtis are cached as not blacklisted, blacklisting overwrites the entry, so
+refreshing a fresh token skips the query too. That negative is only trusted
+while the default cache is shared by every process, a miss always falls
+back to the database.
+"""
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import RefreshToken, Token
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+def _blacklisted_key(jti: str) -> str:
+    return f"token-blacklist:{jti}"
+
+
+def _remaining_seconds(expires_at) -> int:
+    return max(int((expires_at - timezone.now()).total_seconds()), 1)
+
+
+def _trusts_issued() -> bool:
+    # A per process cache misses blacklistings made by other workers
+    return not isinstance(caches["default"], LocMemCache)
+
+
+def cache_blacklisted(jti: str, expires_at) -> None:
+    cache.set(_blacklisted_key(jti), True, timeout=_remaining_seconds(expires_at))
+
+
+class CachedBlacklistRefreshToken(RefreshToken):
+    def set_jti(self) -> None:
+        """New jti, on login and on rotation, cached as not blacklisted"""
+        super().set_jti()
+        if _trusts_issued():
+            cache.set(
+                _blacklisted_key(self.payload[api_settings.JTI_CLAIM]),
+                False,
+                timeout=int(self.lifetime.total_seconds()),
+            )
+
+    def check_blacklist(self) -> None:
+        jti = self.payload[api_settings.JTI_CLAIM]
+        blacklisted = cache.get(_blacklisted_key(jti))
+        if blacklisted:
+            raise TokenError("Token is blacklisted")
+        if blacklisted is False and _trusts_issued():
+            return
+
+        blacklisted = (
+            BlacklistedToken.objects.filter(token__jti=jti)
+            .values_list("token__expires_at", flat=True)
+            .first()
+        )
+        if blacklisted is not None:
+            cache_blacklisted(jti, blacklisted)
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self) -> None:
+        """Blacklist with one conflict ignoring insert and cache the jti"""
+        jti = self.payload[api_settings.JTI_CLAIM]
+        expires_at = datetime_from_epoch(self.payload["exp"])
+
+        token, _ = OutstandingToken.objects.get_or_create(
+            jti=jti, defaults={"token": str(self), "expires_at": expires_at}
+        )
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token=token)], ignore_conflicts=True
+        )
+        cache_blacklisted(jti, expires_at)
+
+
+class StreamToken(Token):
+    """Short-lived token opening the event stream, it authenticates nothing
+    else"""
+
+    token_type = "stream"
+    lifetime = settings.EVENTS_TOKEN_LIFETIME
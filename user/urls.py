@@ -1,12 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import (
-    TokenRefreshView,
-)
 
+from user.async_views import AsyncProfileListView
 from user.views import (
     RegisterView,
     EmailTokenObtainPairView,
+    CachedBlacklistTokenRefreshView,
     LogoutView,
     AllUsersProfileViewSet,
     MyUserProfileViewSet,
@@ -19,8 +18,17 @@ router.register("my-profile", MyUserProfileViewSet, basename="my-profile")
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="register_user"),
     path("token/", EmailTokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path(
+        "token/refresh/",
+        CachedBlacklistTokenRefreshView.as_view(),
+        name="token_refresh",
+    ),
     path("logout/", LogoutView.as_view(), name="auth_logout"),
+    path(
+        "async/profiles/",
+        AsyncProfileListView.as_view(),
+        name="async-profiles-list",
+    ),
     path("", include(router.urls)),
 ]
 
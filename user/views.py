@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework.decorators import action
@@ -12,19 +13,31 @@ from rest_framework import status, mixins, viewsets, permissions
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from social_media.cache import AnonymousResponseCacheMixin
+from social_media.timeline import backfill_timeline, remove_from_timeline
 
 from .filters import UserProfileFilter
 from .models import UserProfile
+from .pagination import UserCursorPagination
+from . import search
 from .serializers import (
     UserSerializer,
     TokenObtainPairSerializer,
+    TokenRefreshSerializer,
     UserProfileSerializer,
     UserProfileListSerializer,
     UserProfileDetailSerializer,
     UserProfileFollowSerializer,
+    UserTypeaheadSerializer,
 )
+from .throttling import LoginAccountThrottle, LoginIPThrottle
+from .tokens import CachedBlacklistRefreshToken
+
+
+def username_prefetch(lookup: str) -> Prefetch:
+    return Prefetch(lookup, queryset=get_user_model().objects.only("id", "username"))
 
 
 class RegisterView(CreateAPIView):
@@ -45,7 +58,7 @@ class LogoutView(APIView):
         """Endpoint for logging out and making token invalid"""
         try:
             refresh_token = request.data["refresh_token"]
-            token = RefreshToken(refresh_token)
+            token = CachedBlacklistRefreshToken(refresh_token)
             token.blacklist()
 
             return Response(status=status.HTTP_200_OK)
@@ -67,23 +80,33 @@ class LogoutView(APIView):
 
 class EmailTokenObtainPairView(TokenObtainPairView):
     serializer_class = TokenObtainPairSerializer
+    throttle_classes = [LoginIPThrottle, LoginAccountThrottle]
+
+
+class CachedBlacklistTokenRefreshView(TokenRefreshView):
+    serializer_class = TokenRefreshSerializer
 
 
 class AllUsersProfileViewSet(
-    GenericViewSet, mixins.ListModelMixin, mixins.RetrieveModelMixin
+    AnonymousResponseCacheMixin,
+    GenericViewSet,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
 ):
+    cache_namespace = "profiles"
     filter_backends = [DjangoFilterBackend]
     filterset_class = UserProfileFilter
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = UserCursorPagination
 
     def get_queryset(self):
-        queryset = UserProfile.objects.all().prefetch_related("user")
+        queryset = UserProfile.objects.select_related("user")
         if self.request.user.is_authenticated:
             user = self.request.user
             queryset = queryset.exclude(user=user)
 
-        if self.action == "list":
-            queryset = queryset.annotate(followers_amount=Count("followed_by"))
+        if self.action == "retrieve":
+            queryset = queryset.prefetch_related(username_prefetch("followed_by"))
 
         return queryset
 
@@ -97,6 +120,9 @@ class AllUsersProfileViewSet(
         if self.action == "follow_user":
             return UserProfileFollowSerializer
 
+        if self.action == "typeahead":
+            return UserTypeaheadSerializer
+
         return UserProfileSerializer
 
     @action(
@@ -106,18 +132,33 @@ class AllUsersProfileViewSet(
         permission_classes=[IsAuthenticated],
     )
     def follow_user(self, request: Request, pk=None) -> Response:
-        """Endpoint for following specified user"""
+        """Endpoint for following (`follow: true`) or unfollowing
+        (`follow: false`) specified user. Toggles when `follow` is omitted"""
         user_profile = self.get_object()
         user = self.request.user
 
-        if user in user_profile.followed_by.all():
-            user_profile.followed_by.remove(user)
-        else:
-            user_profile.followed_by.add(user)
+        serializer = UserProfileFollowSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        follow = serializer.validated_data.get("follow")
+
+        with transaction.atomic():
+            if follow is None:
+                follow = not user_profile.is_followed_by(user)
+
+            if follow:
+                if user_profile.add_follower(user):
+                    backfill_timeline(user.id, user_profile)
+            elif user_profile.remove_follower(user):
+                remove_from_timeline(user.id, user_profile)
 
-        user_profile.refresh_from_db()
+        followers_amount = UserProfile.objects.values_list(
+            "followers_amount", flat=True
+        ).get(pk=user_profile.pk)
+        serializer = UserProfileFollowSerializer(
+            {"follow": follow, "followers_amount": followers_amount}
+        )
 
-        return Response(status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         methods=["GET"],
@@ -129,18 +170,54 @@ class AllUsersProfileViewSet(
         """Endpoint to see profiles active user is following"""
         user = self.request.user
 
-        followed_profiles = UserProfile.objects.filter(followed_by=user)
+        followed_profiles = (
+            UserProfile.objects.filter(followed_by=user)
+            .select_related("user")
+            .prefetch_related(username_prefetch("followed_by"))
+        )
+        page = self.paginate_queryset(followed_profiles)
 
-        serializer = UserProfileDetailSerializer(followed_profiles, many=True)
+        serializer = UserProfileDetailSerializer(page, many=True)
 
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "q",
+                type={"type": "str"},
+                description="Username prefix (ex. ?q=jo)",
+            ),
+            OpenApiParameter(
+                "limit",
+                type={"type": "int"},
+                description="Max amount of results (ex. ?limit=5)",
+            ),
+        ]
+    )
+    @action(methods=["GET"], detail=False, url_path="typeahead")
+    def typeahead(self, request: Request) -> Response:
+        """Endpoint for username autocompletion, followed users come first"""
+        try:
+            limit = int(request.query_params.get("limit", ""))
+        except ValueError:
+            limit = None
+        if limit is not None and limit < 1:
+            limit = None
+
+        results = search.typeahead(
+            request.query_params.get("q", ""), request.user, limit=limit
+        )
+        serializer = UserTypeaheadSerializer(results, many=True)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @extend_schema(
         parameters=[
             OpenApiParameter(
                 "username",
                 type={"type": "str"},
-                description="Filter profiles by username(ex. ?username=username)",
+                description="Filter profiles by username prefix(ex. ?username=user)",
             )
         ]
     )
@@ -153,7 +230,9 @@ class MyUserProfileViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        queryset = UserProfile.objects.filter(user=self.request.user)
+        queryset = UserProfile.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch("followed_by", queryset=get_user_model().objects.only("id"))
+        )
         return queryset
 
     @action(
@@ -166,13 +245,16 @@ class MyUserProfileViewSet(viewsets.ModelViewSet):
     )
     def follower_list(self, request):
         """Endpoint to get list of users who follows request.user profile"""
-        user_profile = UserProfile.objects.get(user=request.user)
+        user_profile = request.user.profile
 
         followers = user_profile.followed_by.all()
 
-        serializer = UserSerializer(followers, many=True)
+        paginator = UserCursorPagination()
+        page = paginator.paginate_queryset(followers, request, view=self)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = UserSerializer(page, many=True)
+
+        return paginator.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)